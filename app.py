@@ -1,13 +1,18 @@
 import streamlit as st
-from ingest.document_loader import load_documents, load_uploaded_documents, chunk_documents
-from retrieval.embedder import embed_chunks
-from retrieval.vectorstore import QdrantVectorStore
-from generation.llm_wrapper import generate_answer
+from retrieval.base import get_vectorstore, query_cache, embed_query
+from retrieval.reranker import rerank
+from ingest.incremental import sync_uploaded_documents, IngestManifest
+from generation.llm_wrapper import warm_up, UNAVAILABLE_MESSAGE
+from generation.answer_cache import get_answer_cache
+from generation.context_packer import pack_context
+from generation.async_client import get_scheduler
 from utils.logger import get_logger
 from utils.timer import Timer
 import config
 import os
 import time
+import threading
+import uuid
 import psutil
 from streamlit_lottie import st_lottie
 import requests
@@ -26,17 +31,34 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# One vector store per server process, shared by every browser session
+@st.cache_resource
+def get_shared_vectorstore():
+    return get_vectorstore()
+
+# Load the LLM once per server process, in the background, so the first question doesn't pay for it
+@st.cache_resource
+def start_llm_warm_up():
+    thread = threading.Thread(target=warm_up, daemon=True)
+    thread.start()
+    return thread
+
+if config.LLM_WARMUP:
+    start_llm_warm_up()
+
 # Chat message display function
-def display_chat_message(message, is_user=False):
+def display_chat_message(message, is_user=False, container=None):
+    # container: e.g. an st.empty() placeholder, to redraw a message in place while it streams
+    container = container or st
     if is_user:
-        st.markdown(f"""
+        container.markdown(f"""
         <div class="chat-message user-message">
             <div class="avatar user-avatar">👤</div>
             <div class="message-content user-content">{message}</div>
         </div>
         """, unsafe_allow_html=True)
     else:
-        st.markdown(f"""
+        container.markdown(f"""
         <div class="chat-message ai-message">
             <div class="avatar ai-avatar">🤖</div>
             <div class="message-content ai-content">{message}</div>
@@ -54,6 +76,8 @@ if 'theme' not in st.session_state:
     st.session_state.theme = 'light'
 if 'show_intro' not in st.session_state:
     st.session_state.show_intro = True
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex  # Fair-queueing key for LLM requests
 
 # Add CSS styles with theme support
 if st.session_state.theme == "dark":
@@ -1191,26 +1215,28 @@ with st.sidebar:
         </div>
         """, unsafe_allow_html=True)
         
+        full_rebuild = st.checkbox(
+            "Full rebuild",
+            value=not config.INCREMENTAL_INGEST,
+            help="Re-embed every file instead of only the ones that changed since the last run"
+        )
+        embed_workers = st.number_input(
+            "Embedding processes",
+            min_value=0,
+            value=config.EMBED_WORKERS,
+            help="Worker processes used to embed chunks. 0 = auto (from CPU cores and free memory), 1 = no extra processes"
+        )
+        
         # Enhanced process button
         if st.button("🚀 Process Documents", type="primary", use_container_width=True):
             with st.spinner("Processing documents..."):
                 try:
-                    # Load documents
-                    documents = load_uploaded_documents(uploaded_files)
-                    st.info(f"📚 Loaded {len(documents)} documents")
-                    
-                    # Chunk documents
-                    chunks = chunk_documents(documents)
-                    st.info(f"✂️ Created {len(chunks)} chunks")
-                    
-                    # Embed chunks
-                    embeddings = embed_chunks(chunks)
-                    st.info(f"🔢 Generated {len(embeddings)} embeddings")
-                    
-                    # Store in vector database
-                    vectorstore = QdrantVectorStore()
-                    vectorstore.reset_collection()
-                    vectorstore.add_embeddings(embeddings, chunks)
+                    # Load, chunk, embed and store only what changed
+                    vectorstore = get_shared_vectorstore()
+                    stats = sync_uploaded_documents(vectorstore, uploaded_files, rebuild=full_rebuild,
+                                                    embed_workers=int(embed_workers))
+                    st.info(f"📚 {stats['files_changed']} changed, {stats['files_unchanged']} unchanged, {stats['files_removed']} removed file(s)")
+                    st.info(f"🔢 Embedded {stats['chunks_embedded']} chunks, deleted {stats['chunks_deleted']} stale chunks")
                     st.session_state.vectorstore = vectorstore
                     st.session_state.documents_processed = True
                     
@@ -1287,7 +1313,7 @@ with st.sidebar:
     with status_col2:
         # Check Ollama
         try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=5)
+            response = requests.get(config.OLLAMA_URL + "/api/tags", timeout=5)
             if response.status_code == 200:
                 st.markdown("""
                 <div style="
@@ -1328,6 +1354,12 @@ with st.sidebar:
             </div>
             """, unsafe_allow_html=True)
     
+    cache_stats = query_cache.stats()
+    st.caption(f"⚡ Query cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+    if config.ANSWER_CACHE_ENABLED:
+        answer_stats = get_answer_cache().stats()
+        st.caption(f"⚡ Answer cache: {answer_stats['hits']} hits / {answer_stats['misses']} misses")
+    
     st.markdown("---")
     
     # Clear chat button with enhanced styling
@@ -1378,6 +1410,15 @@ else:
     # Chat interface
     st.subheader("💬 Chat with your documents")
     
+    # Optional document scope: filtered search only looks at the selected files
+    manifest = IngestManifest.load()
+    indexed_files = sorted(manifest.files) if manifest.collection == st.session_state.vectorstore.name else []
+    search_scope = st.multiselect(
+        "🔎 Limit answers to these documents",
+        options=indexed_files,
+        help="Leave empty to search all processed documents"
+    )
+    
     # Display chat messages
     for message in st.session_state.messages:
         display_chat_message(message["content"], message["role"] == "user")
@@ -1389,41 +1430,97 @@ else:
         display_chat_message(prompt, is_user=True)
         
         # Generate response
-        with st.spinner("🤖 Thinking..."):
-            try:
+        job = None
+        try:
+            # The spinner covers retrieval and the wait for the first token; the rest streams in
+            with st.spinner("🤖 Thinking..."):
                 # Retrieve relevant documents
-                relevant_docs = st.session_state.vectorstore.search(prompt, top_k=5)
+                if config.RERANK_ENABLED:
+                    # Over-fetch, then keep the chunks the cross-encoder rates most relevant
+                    candidates = st.session_state.vectorstore.search(
+                        prompt, top_k=config.RERANK_CANDIDATES, filenames=search_scope or None
+                    )
+                    relevant_docs = rerank(prompt, candidates)
+                else:
+                    relevant_docs = st.session_state.vectorstore.search(prompt, top_k=5, filenames=search_scope or None)
                 
-                # Generate answer
-                response = generate_answer(prompt, relevant_docs)
-                answer = response["text"] if isinstance(response, dict) else response
+                # Reuse the answer to an earlier, similar question over the same chunks
+                answer_cache = get_answer_cache() if config.ANSWER_CACHE_ENABLED else None
+                cached_answer = None
+                if answer_cache is not None:
+                    index_version = st.session_state.vectorstore.index_version()
+                    cached_answer = answer_cache.get(embed_query(prompt), relevant_docs, index_version)
                 
-                # Add assistant message
-                st.session_state.messages.append({"role": "assistant", "content": answer})
-                display_chat_message(answer, is_user=False)
+                if cached_answer is not None:
+                    tokens = iter(())
+                    answer = cached_answer
+                else:
+                    # Fit the chunks into the model's context window
+                    context_chunks = relevant_docs
+                    if config.CONTEXT_PACKING:
+                        packed = pack_context(prompt, relevant_docs)
+                        context_chunks = packed["chunks"]
+                        if packed["dropped"] or packed["trimmed"]:
+                            left_out = ", ".join(f"{c['filename']} #{c['chunk_id']}" for c in packed["dropped"])
+                            st.caption(
+                                f"✂️ Context trimmed to {packed['budget']} tokens: "
+                                f"{len(packed['trimmed'])} passage(s) shortened"
+                                + (f", left out: {left_out}" if left_out else "")
+                            )
+                    
+                    # Generate answer: queued fairly with the other sessions' questions
+                    job = get_scheduler().submit(st.session_state.session_id, prompt, context_chunks)
+                    queue_notice = st.empty()
+                    while not job.wait_started(timeout=0.5):
+                        queue_notice.caption(f"⏳ Waiting for the model: #{job.position()} in line")
+                    queue_notice.empty()
+                    tokens = job.tokens()
+                    answer = next(tokens, "")
+            
+            answer_placeholder = st.empty()
+            last_render = 0.0
+            for token in tokens:
+                answer += token
+                # Re-render at most ~20 times a second rather than once per token
+                if time.monotonic() - last_render > 0.05:
+                    display_chat_message(answer.strip() + " ▌", is_user=False, container=answer_placeholder)
+                    last_render = time.monotonic()
+            answer = answer.strip()
+            display_chat_message(answer, is_user=False, container=answer_placeholder)
+            if cached_answer is not None:
+                st.caption("⚡ Answered from cache")
+            elif answer_cache is not None and job.state == "done" and answer != UNAVAILABLE_MESSAGE:
+                answer_cache.put(embed_query(prompt), relevant_docs, index_version, answer)
+            
+            # Add assistant message
+            st.session_state.messages.append({"role": "assistant", "content": answer})
 
-                # Display supporting chunks below the answer
-                st.markdown("""
-                <div style='margin: 1.5em 0 2em 0; padding: 1em; border-radius: 12px; background: rgba(102,126,234,0.07);'>
-                <b>🔎 Supporting Chunks:</b>
-                <ul style='margin-top: 0.5em;'>
+            # Display supporting chunks below the answer
+            st.markdown("""
+            <div style='margin: 1.5em 0 2em 0; padding: 1em; border-radius: 12px; background: rgba(102,126,234,0.07);'>
+            <b>🔎 Supporting Chunks:</b>
+            <ul style='margin-top: 0.5em;'>
+            """, unsafe_allow_html=True)
+            for chunk in relevant_docs:
+                st.markdown(f"""
+                <li style='margin-bottom: 0.7em;'>
+                    <b>File:</b> {chunk.get('filename', 'N/A')}<br>
+                    <b>Page:</b> {chunk.get('page', 'N/A')}<br>
+                    <b>Chunk ID:</b> {chunk.get('chunk_id', 'N/A')}<br>
+                    <b>Preview:</b> <span style='color:#444;'>{chunk.get('chunk_text', '')[:200]}{'...' if len(chunk.get('chunk_text','')) > 200 else ''}</span>
+                </li>
                 """, unsafe_allow_html=True)
-                for chunk in relevant_docs:
-                    st.markdown(f"""
-                    <li style='margin-bottom: 0.7em;'>
-                        <b>File:</b> {chunk.get('filename', 'N/A')}<br>
-                        <b>Page:</b> {chunk.get('page', 'N/A')}<br>
-                        <b>Chunk ID:</b> {chunk.get('chunk_id', 'N/A')}<br>
-                        <b>Preview:</b> <span style='color:#444;'>{chunk.get('chunk_text', '')[:200]}{'...' if len(chunk.get('chunk_text','')) > 200 else ''}</span>
-                    </li>
-                    """, unsafe_allow_html=True)
-                st.markdown("</ul></div>", unsafe_allow_html=True)
-                
-            except Exception as e:
-                error_msg = f"Sorry, I encountered an error: {str(e)}"
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
-                display_chat_message(error_msg, is_user=False)
-                logger.error(f"Chat error: {e}")
+            st.markdown("</ul></div>", unsafe_allow_html=True)
+            
+        except Exception as e:
+            error_msg = f"Sorry, I encountered an error: {str(e)}"
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
+            display_chat_message(error_msg, is_user=False)
+            logger.error(f"Chat error: {e}")
+        finally:
+            # Frees the model if the run was interrupted (user left, new question, stop button)
+            if job is not None:
+                job.cancel()
     
     # Add some spacing before footer
     st.markdown("<br><br>", unsafe_allow_html=True)
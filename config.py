@@ -9,8 +9,28 @@ LLM_MODEL_PATH = "models/phi-3-mini-4k-instruct-q4.gguf"  # or mistral GGUF
 # LLM backend: 'ctransformers' (default, local GGUF) or 'ollama' (Ollama server)
 LLM_BACKEND = "ollama"
 OLLAMA_MODEL = "mistral"  # or "llama3", "phi3", etc. (must match a model you have pulled in Ollama)
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_KEEP_ALIVE = "30m"  # How long Ollama keeps the model loaded after a request; -1 = forever
+LLM_WARMUP = True  # Load the model when the app starts instead of on the first question
+OLLAMA_POOL_SIZE = 8  # Kept-alive HTTP connections to Ollama (chat generation queue and warm-up); at least LLM_CONCURRENCY
+OLLAMA_TIMEOUT = 120  # Seconds
+OLLAMA_NUM_CTX = 4096  # Context window in tokens; must hold the prompt plus the answer
+OLLAMA_NUM_THREAD = None  # CPU threads for generation; None = Ollama default (physical cores)
+LLM_MAX_NEW_TOKENS = 128  # Answer length limit (Ollama num_predict / ctransformers max_new_tokens)
+LLM_CONCURRENCY = 1  # Generations run at once across all sessions; match OLLAMA_NUM_PARALLEL on the server
 
-# Chunking
+# Context packing: merge overlapping/adjacent chunks of the same file and fit them into the
+# model's context window, leaving LLM_MAX_NEW_TOKENS for the answer
+CONTEXT_PACKING = True
+CONTEXT_TOKEN_BUDGET = None  # Tokens for the context blocks; None = context window - answer - rest of the prompt
+CONTEXT_SAFETY_TOKENS = 32  # Margin for tokenizer differences
+CONTEXT_MIN_TRIM_TOKENS = 64  # A block is cut to fit only if at least this much room is left
+OLLAMA_TOKENIZER = None  # Hugging Face tokenizer matching OLLAMA_MODEL (dir, models/<name> or hub id) for exact counts
+CHARS_PER_TOKEN_ESTIMATE = 3  # Used when no tokenizer is available; low on purpose so the estimate errs long
+
+# Chunking (in words); context packing removes exactly CHUNK_OVERLAP words between adjacent chunks.
+# The ingest manifest records the values used: after changing either, the next "Process Documents"
+# (or python -m ingest.pipeline) re-chunks and re-embeds every file, even unchanged ones
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 128
 EMBEDDING_DIM = 384  # bge-small-en-v1.5
@@ -19,11 +39,118 @@ EMBEDDING_DIM = 384  # bge-small-en-v1.5
 DATA_DIR = "data"
 INDEX_DIR = "docs_index"
 MODELS_DIR = "models"
+CACHE_DIR = "cache"  # Kept apart from INDEX_DIR so wiping the Qdrant volume keeps the caches
+
+# Embedding backend: 'sentence-transformers' (PyTorch) or 'onnx' (ONNX Runtime, CPU)
+# Create the ONNX model with: python -m retrieval.onnx_embedder --export --check
+EMBEDDING_BACKEND = "sentence-transformers"
+ONNX_MODEL_DIR = MODELS_DIR + "/bge-small-en-v1.5-onnx"
+ONNX_QUANTIZE = True  # Use the int8 dynamically-quantized model
+ONNX_INTRA_OP_THREADS = 0  # 0 = let ONNX Runtime use all physical cores
+ONNX_PARITY_MIN_COSINE = 0.9999  # --check thresholds against the PyTorch embeddings
+ONNX_PARITY_MIN_COSINE_INT8 = 0.99
+
+# Embedding batching
+# Chunks are sorted by token length and grouped so little compute is spent on padding
+EMBED_BATCH_SIZE = 64  # Max chunks per encode call
+EMBED_MAX_BATCH_TOKENS = 16384  # Max padded tokens (batch size x longest chunk) per encode call
+
+# Embedding worker processes for large ingests (each holds its own model copy)
+EMBED_WORKERS = 1  # 1 = embed in the main process, 0 = auto from cores and free memory, N = fixed
+EMBED_THREADS_PER_WORKER = 4  # Used by auto sizing; workers are pinned to their own cores
+EMBED_WORKER_MEMORY_MB = 1024  # Memory budget per worker used by auto sizing
+
+# Embedding cache
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = CACHE_DIR + "/embeddings.sqlite"
+
+# Document loading
+LOADER_WORKERS = 0  # Processes used to parse documents; 0 = one per CPU core, 1 = no process pool
+PDF_PAGES_PER_TASK = 25  # Large PDFs are split into page ranges of this size across workers
+PDF_SPILL_BYTES = 8 * 1024 * 1024  # Uploaded PDFs bigger than this are handed to workers via a temp file
+
+# Ingest pipeline
+INGEST_BATCH_SIZE = 256  # Chunks embedded and upserted per batch
+INGEST_QUEUE_SIZE = 4  # Batches buffered between pipeline stages
+
+# Incremental ingestion
+# When enabled, "Process Documents" only re-embeds files whose content changed
+# and deletes chunks of files that were removed, instead of rebuilding everything.
+INCREMENTAL_INGEST = True
+INGEST_MANIFEST_PATH = INDEX_DIR + "/ingest_manifest.json"
+
+# Vector store backend: 'qdrant' (Qdrant server) or 'local' (embedded exact search, no server)
+VECTOR_STORE_BACKEND = "qdrant"
+LOCAL_INDEX_DIR = INDEX_DIR + "/local"
+LOCAL_VECTOR_DTYPE = "float32"  # or "float16" to halve memory
 
 # Qdrant
 QDRANT_HOST = "localhost"
 QDRANT_PORT = 6333
-QDRANT_COLLECTION = "rag_chunks"
+QDRANT_GRPC_PORT = 6334
+QDRANT_PREFER_GRPC = False  # gRPC sends vectors as binary protobuf instead of JSON
+QDRANT_TIMEOUT = 30  # Seconds per request
+QDRANT_POOL_SIZE = None  # Connections (REST) / channels (gRPC) in the shared client's pool; None = client default
+QDRANT_COLLECTION = "rag_chunks"  # Alias of the live versioned collection (rag_chunks_v<millis>)
+QDRANT_KEEP_VERSIONS = 1  # Previous collection versions kept after a rebuild, for rollback
+# Collection profile applied when the collection is created (see PROFILE_DEFAULTS in retrieval/vectorstore.py).
+# Quantized profiles keep int8/binary vectors in RAM and the float32 originals on disk,
+# oversample candidates from the quantized index and rescore them with the originals.
+QDRANT_COLLECTION_PROFILE = "default"
+QDRANT_COLLECTION_PROFILES = {
+    "default": {},  # Plain float32 vectors and payloads in RAM
+    "scalar": {"quantization": "scalar", "on_disk_vectors": True, "oversampling": 2.0},  # ~4x less RAM
+    "binary": {"quantization": "binary", "on_disk_vectors": True, "oversampling": 3.0},  # ~32x less RAM
+}
+QDRANT_UPSERT_BATCH_SIZE = 256  # Points per upsert request
+QDRANT_UPSERT_PARALLEL = 4  # Upsert requests in flight at once
+QDRANT_UPSERT_WAIT = False  # False: don't wait for each batch to be applied, only once at the end
+QDRANT_UPSERT_RETRIES = 3  # Retries (with exponential backoff) on transient failures
+QDRANT_SEARCH_BATCH_SIZE = 256  # Queries per batch query request (search_many)
+
+# Chunk docstore: keep chunk text/metadata in a local compressed store keyed by point id,
+# so Qdrant payloads only carry the filterable fields. Points stored before it was enabled keep
+# their full payloads and are read from Qdrant until the next full rebuild moves them over.
+DOCSTORE_ENABLED = False
+DOCSTORE_PATH = INDEX_DIR + "/docstore.sqlite"
+DOCSTORE_MMAP_BYTES = 256 * 1024 * 1024
+
+# Search mode: 'dense' or 'hybrid' (dense + BM25 keyword search, fused with reciprocal-rank fusion).
+# The BM25 index is only maintained in hybrid mode; after switching it on, run a full rebuild.
+SEARCH_MODE = "dense"
+BM25_DIR = INDEX_DIR + "/bm25"  # One BM25 index per Qdrant collection version (local store: inside its dir)
+HYBRID_CANDIDATES = 20  # Candidates taken from each leg before fusion
+RRF_K = 60  # Larger values flatten the rank weighting
+HYBRID_SEARCH_THREADS = 4
+
+# Cross-encoder reranking: over-fetch RERANK_CANDIDATES chunks, rescore each (query, chunk) pair
+# and pass only the best MAX_CONTEXT_CHUNKS to the LLM
+RERANK_ENABLED = False
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"  # Loaded from models/<name> if present
+RERANK_CANDIDATES = 20
+RERANK_BATCH_SIZE = 32  # Pairs per forward pass; >= RERANK_CANDIDATES scores everything in one pass
+RERANK_MAX_LENGTH = 512  # Tokens per (query, chunk) pair
+RERANK_BUDGET_MS = 500  # No new batch is started after this; 0 = no limit
+RERANK_CACHE_SIZE = 4096
+RERANK_CACHE_TTL = 3600  # Seconds; 0 = never expire
+
+# Maximal marginal relevance: choose the final top_k out of MMR_FETCH_K candidates,
+# trading relevance against similarity to chunks already chosen (drops overlapping windows)
+MMR_ENABLED = False
+MMR_FETCH_K = 20
+MMR_LAMBDA = 0.5  # 1.0 = pure relevance, 0.0 = pure diversity
+
+# Query embedding cache (normalized query text -> vector)
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL = 3600  # Seconds; 0 = never expire
+
+# Semantic answer cache: reuse a stored answer when the same chunks are retrieved for a question
+# whose embedding is within ANSWER_CACHE_THRESHOLD (cosine) of a cached one. Cleared on index rebuilds.
+ANSWER_CACHE_ENABLED = False
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_MEMORY_SIZE = 256  # Chunk sets kept in memory; everything is also stored on disk
+ANSWER_CACHE_TTL = 7 * 24 * 3600  # Seconds; 0 = never expire
+ANSWER_CACHE_PATH = CACHE_DIR + "/answers.sqlite"
 
 # Other
 MAX_CONTEXT_CHUNKS = 3
\ No newline at end of file
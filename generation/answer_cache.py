@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from generation.llm_wrapper import PROMPT_TEMPLATE
+from utils.lru_cache import LRUCache
+import config
+
+
+def chunk_set_key(chunks):
+    """Order-independent key of the retrieved chunks."""
+    point_ids = sorted(str(c.get("point_id", (c.get("filename"), c.get("chunk_id")))) for c in chunks)
+    return hashlib.sha256(json.dumps(point_ids).encode("utf-8")).hexdigest()
+
+def generation_settings_key():
+    # A different model, prompt or answer length must not serve answers generated under the old one,
+    # nor a different packing of the same chunks into the context (merged, trimmed or dropped blocks)
+    settings = [config.LLM_BACKEND, config.OLLAMA_MODEL, config.LLM_MODEL_PATH,
+                config.LLM_MAX_NEW_TOKENS, PROMPT_TEMPLATE,
+                config.CONTEXT_PACKING, config.CONTEXT_TOKEN_BUDGET, config.CONTEXT_SAFETY_TOKENS,
+                config.CONTEXT_MIN_TRIM_TOKENS, config.OLLAMA_NUM_CTX, config.OLLAMA_TOKENIZER,
+                config.CHARS_PER_TOKEN_ESTIMATE, config.CHUNK_OVERLAP]
+    return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by the retrieved chunk set, matched by query embedding: a stored answer is
+    reused when the same chunks were retrieved and the new query's embedding has cosine
+    similarity >= threshold with the cached query's. Entries belong to one index version
+    and generation setup; rows from other index versions are dropped when a new one is seen.
+
+    Two tiers: an in-memory LRU of chunk sets -> [(query embedding, answer)], backed by SQLite.
+    """
+    def __init__(self, path=None, threshold=None, memory_size=None, ttl=None):
+        self.path = path or config.ANSWER_CACHE_PATH
+        self.threshold = config.ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self.ttl = config.ANSWER_CACHE_TTL if ttl is None else ttl
+        self.memory = LRUCache(maxsize=memory_size or config.ANSWER_CACHE_MEMORY_SIZE, ttl=self.ttl)
+        self.hits = 0
+        self.misses = 0
+        self._index_version = None
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "index_version TEXT NOT NULL, settings TEXT NOT NULL, chunk_key TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, answer TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_lookup ON answers (index_version, settings, chunk_key)")
+        self._conn.commit()
+
+    def _switch_index_version(self, index_version):
+        # Called with the lock held
+        if index_version == self._index_version:
+            return
+        self._conn.execute("DELETE FROM answers WHERE index_version != ?", (index_version,))
+        self._conn.commit()
+        self.memory.clear()
+        self._index_version = index_version
+
+    def _entries(self, group):
+        # Called with the lock held
+        entries = self.memory.get(group)
+        if entries is None:
+            index_version, settings, chunk_key = group
+            rows = self._conn.execute(
+                "SELECT embedding, answer FROM answers "
+                "WHERE index_version = ? AND settings = ? AND chunk_key = ? AND (? = 0 OR created > ?)",
+                (index_version, settings, chunk_key, self.ttl, time.time() - (self.ttl or 0))
+            )
+            entries = [(np.frombuffer(blob, dtype=np.float32), answer) for blob, answer in rows]
+            self.memory.put(group, entries)
+        return entries
+
+    def get(self, query_emb, chunks, index_version):
+        """The cached answer for a similar query over the same chunks, or None."""
+        if not chunks:
+            return None
+        group = (str(index_version), generation_settings_key(), chunk_set_key(chunks))
+        query_emb = np.asarray(query_emb, dtype=np.float32)
+        query_emb = query_emb / max(float(np.linalg.norm(query_emb)), 1e-12)
+        with self._lock:
+            self._switch_index_version(group[0])
+            entries = self._entries(group)
+            if entries:
+                similarities = np.stack([emb for emb, _ in entries]) @ query_emb
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    return entries[best][1]
+            self.misses += 1
+            return None
+
+    def put(self, query_emb, chunks, index_version, answer):
+        if not chunks:
+            return
+        group = (str(index_version), generation_settings_key(), chunk_set_key(chunks))
+        query_emb = np.asarray(query_emb, dtype=np.float32)
+        query_emb = query_emb / max(float(np.linalg.norm(query_emb)), 1e-12)
+        with self._lock:
+            self._switch_index_version(group[0])
+            entries = self._entries(group)
+            self.memory.put(group, entries + [(query_emb, answer)])
+            self._conn.execute(
+                "INSERT INTO answers (index_version, settings, chunk_key, embedding, answer, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (*group, query_emb.tobytes(), answer, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache()
+    return _cache
@@ -0,0 +1,188 @@
+import asyncio
+import heapq
+import itertools
+import json
+import queue
+import threading
+import httpx
+from generation.llm_wrapper import build_prompt, get_llm, ollama_payload, UNAVAILABLE_MESSAGE
+import config
+
+# Generation requests from every Streamlit session go through one scheduler per process.
+# It runs an asyncio event loop in a background thread, starts at most LLM_CONCURRENCY
+# generations at once and queues the rest:
+#   - lower priority values go first;
+#   - within a priority, sessions take turns (start-time fair queuing), so one session
+#     sending many questions cannot starve the others;
+#   - otherwise first come, first served.
+
+_FINISHED = object()
+
+
+class GenerationJob:
+    """Handle for a queued or running generation, used from the Streamlit script thread."""
+    def __init__(self, scheduler, session_id, prompt, key):
+        self.session_id = session_id
+        self.prompt = prompt
+        self.key = key  # (priority, round, sequence number): heap order
+        self.state = "queued"  # queued -> running -> done, or cancelled
+        self._scheduler = scheduler
+        self._task = None
+        self._tokens = queue.Queue()
+        self._started = threading.Event()  # Also set when the job ends without starting
+
+    def position(self):
+        """1-based place in the queue; 0 once generation has started."""
+        return self._scheduler.position(self)
+
+    def wait_started(self, timeout=None):
+        return self._started.wait(timeout)
+
+    def tokens(self):
+        """Yield text fragments as they are generated. Closing the generator early cancels the job."""
+        try:
+            while True:
+                item = self._tokens.get()
+                if item is _FINISHED:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        self._scheduler.cancel(self)
+
+    def _finish(self):
+        self._tokens.put(_FINISHED)
+        self._started.set()
+
+
+class GenerationScheduler:
+    def __init__(self, concurrency=None):
+        # A ctransformers model is a single in-process instance: one generation at a time
+        self.concurrency = 1 if config.LLM_BACKEND != "ollama" else (concurrency or config.LLM_CONCURRENCY)
+        self._lock = threading.Lock()  # Guards the queue state; position()/cancel() come from script threads
+        self._heap = []
+        self._sequence = itertools.count()
+        self._round = 0  # Round of the job started most recently
+        self._session_rounds = {}  # Session id -> round of its latest queued job
+        self._running = set()
+        self._client = None
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="llm-scheduler", daemon=True).start()
+
+    def submit(self, session_id, user_query, context_chunks, priority=0):
+        prompt = build_prompt(user_query, context_chunks)
+        with self._lock:
+            # A session's next job goes one round after its previous one, but never before
+            # the current round: an idle session re-enters at the back of the current round
+            job_round = max(self._round, self._session_rounds.get(session_id, -1) + 1)
+            self._session_rounds[session_id] = job_round
+            job = GenerationJob(self, session_id, prompt, (priority, job_round, next(self._sequence)))
+            heapq.heappush(self._heap, (job.key, job))
+        self._loop.call_soon_threadsafe(self._dispatch)
+        return job
+
+    def position(self, job):
+        with self._lock:
+            if job.state != "queued":
+                return 0
+            return 1 + sum(1 for key, other in self._heap if other.state == "queued" and key < job.key)
+
+    def cancel(self, job):
+        with self._lock:
+            if job.state not in ("queued", "running"):
+                return
+            task = job._task if job.state == "running" else None
+            job.state = "cancelled"  # Queued jobs are skipped when they reach the top of the heap
+        if task is not None:
+            self._loop.call_soon_threadsafe(task.cancel)
+        job._finish()
+
+    def _dispatch(self):
+        # Runs on the event loop
+        with self._lock:
+            while len(self._running) < self.concurrency and self._heap:
+                key, job = heapq.heappop(self._heap)
+                if job.state != "queued":
+                    continue
+                job.state = "running"
+                self._round = key[1]
+                self._running.add(job)
+                job._task = self._loop.create_task(self._run(job))
+                job._started.set()
+            if len(self._session_rounds) > 1024:
+                # Sessions whose last job is behind the current round would re-enter at it anyway
+                self._session_rounds = {s: r for s, r in self._session_rounds.items() if r > self._round}
+
+    async def _run(self, job):
+        streamed = False
+        try:
+            async for token in self._generate(job.prompt):
+                streamed = True
+                job._tokens.put(token)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"[ERROR] Generation failed: {e}")
+            job._tokens.put(e if streamed or config.LLM_BACKEND != "ollama" else UNAVAILABLE_MESSAGE)
+        finally:
+            with self._lock:
+                self._running.discard(job)
+                if job.state == "running":
+                    job.state = "done"
+            job._finish()
+            self._dispatch()
+
+    async def _generate(self, prompt):
+        if config.LLM_BACKEND == "ollama":
+            if self._client is None:
+                # Never fewer connections than concurrent generations, or they would queue on the pool
+                pool_size = max(self.concurrency, config.OLLAMA_POOL_SIZE)
+                self._client = httpx.AsyncClient(
+                    base_url=config.OLLAMA_URL,
+                    timeout=config.OLLAMA_TIMEOUT,
+                    limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+                )
+            # Ollama sends one JSON object per line while "stream" is true
+            async with self._client.stream("POST", "/api/generate", json=ollama_payload(prompt)) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise RuntimeError(data["error"])
+                    if data.get("response"):
+                        yield data["response"]
+        else:
+            llm = await asyncio.to_thread(get_llm)
+            tokens = llm(prompt, max_new_tokens=config.LLM_MAX_NEW_TOKENS, stop=["\n"], stream=True)
+            step = None
+            try:
+                while True:
+                    # Each token is computed off the loop. The step is shielded: cancelling the job
+                    # must not abandon a next() still running inside the model
+                    step = asyncio.ensure_future(asyncio.to_thread(next, tokens, None))
+                    token = await asyncio.shield(step)
+                    if token is None:
+                        return
+                    yield token
+            finally:
+                # The model is not thread-safe: the slot is only freed (in _run) once it is idle again
+                if step is not None and not step.done():
+                    await asyncio.wait([step])
+                tokens.close()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GenerationScheduler()
+    return _scheduler
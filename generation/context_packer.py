@@ -0,0 +1,157 @@
+import os
+import threading
+from generation.llm_wrapper import PROMPT_TEMPLATE, get_llm
+import config
+
+_SEPARATOR = "\n---\n"  # Between context blocks, as in build_prompt
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+_warned_estimate = False
+
+def _ollama_tokenizer():
+    """
+    Ollama has no tokenize endpoint, so load the Hugging Face tokenizer of the same model
+    (OLLAMA_TOKENIZER: a local directory, or models/<name>, or a hub id). None if unavailable.
+    """
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None and config.OLLAMA_TOKENIZER:
+            source = config.OLLAMA_TOKENIZER
+            local_path = os.path.join(config.MODELS_DIR, os.path.basename(source))
+            if not os.path.exists(source) and os.path.exists(local_path):
+                source = local_path
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(source)
+            except Exception as e:
+                print(f"[WARN] Could not load tokenizer {source}: {e}")
+                _tokenizer = False  # Don't retry on every call
+    return _tokenizer or None
+
+def count_tokens(text):
+    global _warned_estimate
+    if config.LLM_BACKEND != "ollama":
+        return len(get_llm().tokenize(text))
+    tokenizer = _ollama_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    if not _warned_estimate:
+        print("[WARN] No tokenizer for the Ollama model (set OLLAMA_TOKENIZER); estimating tokens from characters")
+        _warned_estimate = True
+    return -(-len(text) // config.CHARS_PER_TOKEN_ESTIMATE)
+
+def context_window():
+    if config.LLM_BACKEND == "ollama":
+        return config.OLLAMA_NUM_CTX
+    return getattr(get_llm(), "context_length", None) or config.OLLAMA_NUM_CTX
+
+def context_budget(user_query):
+    """Tokens left for context: the window minus the answer, the rest of the prompt and a safety margin."""
+    if config.CONTEXT_TOKEN_BUDGET:
+        return config.CONTEXT_TOKEN_BUDGET
+    prompt_tokens = count_tokens(PROMPT_TEMPLATE.format(context="", question=user_query))
+    return context_window() - config.LLM_MAX_NEW_TOKENS - prompt_tokens - config.CONTEXT_SAFETY_TOKENS
+
+def _stream(chunk):
+    # PDF chunks are windows over one page; DOCX/TXT chunks are windows over the whole file
+    # (their 'page' just numbers the chunks)
+    page = chunk.get("page") if chunk.get("total_pages") is not None else None
+    return chunk.get("filename"), page
+
+def _stitch(first, second, overlap):
+    """
+    Join two consecutive windows, keeping their shared words once: the second one starts with
+    the last `overlap` words of the first (fewer for a short last window). None if it doesn't.
+    """
+    a, b = first.split(), second.split()
+    k = min(overlap, len(a), len(b))
+    if k and a[-k:] != b[:k]:
+        return None
+    return " ".join(a + b[k:])
+
+def merge_chunks(chunks, overlap=None):
+    """
+    Merge chunks that are consecutive windows of the same text stream (same file, same PDF page,
+    'window' n, n+1, ...) into one block, removing exactly the `overlap` words (default
+    CHUNK_OVERLAP) they share. Chunks without a 'window' are never merged. Blocks keep the rank
+    of their best chunk and list their members in 'chunk_ids'.
+    """
+    overlap = config.CHUNK_OVERLAP if overlap is None else overlap
+    by_stream = {}
+    blocks = []
+    for rank, chunk in enumerate(chunks):
+        if chunk.get("window") is None:
+            blocks.append((rank, dict(chunk, chunk_ids=[chunk.get("chunk_id")])))
+        else:
+            by_stream.setdefault(_stream(chunk), []).append((rank, chunk))
+    for members in by_stream.values():
+        members.sort(key=lambda item: item[1]["window"])
+        run = [members[0]]
+        text = members[0][1]["chunk_text"]
+        for rank, chunk in members[1:]:
+            stitched = None
+            if chunk["window"] == run[-1][1]["window"] + 1:
+                stitched = _stitch(text, chunk["chunk_text"], overlap)
+            if stitched is not None:
+                run.append((rank, chunk))
+                text = stitched
+                continue
+            blocks.append(_block(run, text))
+            run = [(rank, chunk)]
+            text = chunk["chunk_text"]
+        blocks.append(_block(run, text))
+    blocks.sort(key=lambda item: item[0])
+    return [block for _, block in blocks]
+
+def _block(run, text):
+    first, last = run[0][1], run[-1][1]
+    block = dict(first, chunk_text=text, chunk_ids=[chunk.get("chunk_id") for _, chunk in run])
+    if len(run) > 1 and last.get("source_ref") != first.get("source_ref"):
+        block["source_ref"] = f"{first.get('source_ref')} .. {last.get('source_ref')}"
+    return min(rank for rank, _ in run), block
+
+def _trim(text, max_tokens):
+    # Longest word prefix that fits, by binary search over the word count
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low])
+
+def pack_context(user_query, chunks, budget=None):
+    """
+    Fit retrieved chunks (best first) into the prompt's token budget.
+    Returns {"chunks": blocks to put in the prompt, "dropped": chunks left out,
+             "trimmed": blocks cut short, "tokens": context tokens used, "budget": budget}.
+    A block that does not fit is cut to the remaining budget if at least CONTEXT_MIN_TRIM_TOKENS
+    remain; otherwise it is dropped and smaller lower-ranked blocks may still fit.
+    """
+    budget = context_budget(user_query) if budget is None else budget
+    separator_tokens = count_tokens(_SEPARATOR)
+    packed, dropped, trimmed = [], [], []
+    used = 0
+    for block in merge_chunks(chunks):
+        cost = count_tokens(block["chunk_text"]) + (separator_tokens if packed else 0)
+        remaining = budget - used
+        if cost <= remaining:
+            packed.append(block)
+            used += cost
+            continue
+        available = remaining - (separator_tokens if packed else 0)
+        if available >= config.CONTEXT_MIN_TRIM_TOKENS:
+            text = _trim(block["chunk_text"], available)
+            block = dict(block, chunk_text=text)
+            packed.append(block)
+            trimmed.append(block)
+            used += count_tokens(text) + (separator_tokens if len(packed) > 1 else 0)
+        else:
+            dropped.append(block)
+    if dropped or trimmed:
+        print(f"[DEBUG] Context packing: {len(dropped)} blocks dropped, {len(trimmed)} trimmed "
+              f"to fit {budget} tokens")
+    return {"chunks": packed, "dropped": dropped, "trimmed": trimmed, "tokens": used, "budget": budget}
@@ -1,7 +1,10 @@
 from ctransformers import AutoModelForCausalLM
 import config
+import json
 import os
 import requests
+import threading
+from requests.adapters import HTTPAdapter
 
 PROMPT_TEMPLATE = """
 You are a helpful assistant. Answer the user's question using only the context below.
@@ -16,7 +19,55 @@ Question:
 Answer:
 """
 
+UNAVAILABLE_MESSAGE = "I apologize, but I'm unable to generate a response at the moment. Please check if Ollama is running and the model is available."
+
 _llm = None
+_session = None
+_session_lock = threading.Lock()
+
+def get_ollama_session():
+    """One pooled HTTP session per process, so requests reuse kept-alive connections to Ollama."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=config.OLLAMA_POOL_SIZE))
+            _session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=config.OLLAMA_POOL_SIZE))
+    return _session
+
+def ollama_options():
+    options = {"num_predict": config.LLM_MAX_NEW_TOKENS, "num_ctx": config.OLLAMA_NUM_CTX}
+    if config.OLLAMA_NUM_THREAD:
+        options["num_thread"] = config.OLLAMA_NUM_THREAD
+    return options
+
+def ollama_payload(prompt):
+    return {
+        "model": config.OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": config.OLLAMA_KEEP_ALIVE,
+        "options": ollama_options()
+    }
+
+def warm_up():
+    """
+    Load the model ahead of the first question: for Ollama, a request without a prompt
+    loads the model and keeps it for OLLAMA_KEEP_ALIVE; for ctransformers, load the GGUF.
+    """
+    if config.LLM_BACKEND != "ollama":
+        get_llm()
+        return
+    try:
+        response = get_ollama_session().post(
+            config.OLLAMA_URL + "/api/generate",
+            json={"model": config.OLLAMA_MODEL, "keep_alive": config.OLLAMA_KEEP_ALIVE,
+                  "options": ollama_options()},
+            timeout=config.OLLAMA_TIMEOUT
+        )
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"[WARN] Ollama warm-up failed: {e}")
 
 def get_llm():
     global _llm
@@ -24,11 +75,13 @@ def get_llm():
         _llm = AutoModelForCausalLM.from_pretrained(config.LLM_MODEL_PATH, model_type="phi3", gpu_layers=32)
     return _llm
 
-def generate_answer(user_query, context_chunks):
+def build_prompt(user_query, context_chunks):
     context = "\n---\n".join([c["chunk_text"] for c in context_chunks])
-    prompt = PROMPT_TEMPLATE.format(context=context, question=user_query)
     # Debug: print context_chunks
     print("[DEBUG] context_chunks:", context_chunks)
+    return PROMPT_TEMPLATE.format(context=context, question=user_query)
+
+def get_sources(context_chunks):
     sources = [{
         "filename": c.get("filename"),
         "chunk_id": c.get("chunk_id"),
@@ -38,26 +91,45 @@ def generate_answer(user_query, context_chunks):
     } for c in context_chunks]
     # Debug: print sources
     print("[DEBUG] sources:", sources)
+    return sources
+
+def stream_answer(user_query, context_chunks):
+    """
+    Yield the answer as text fragments as soon as the backend produces them.
+    Sources are not part of the stream; get them with get_sources(context_chunks).
+    """
+    if config.CONTEXT_PACKING:
+        from generation.context_packer import pack_context  # It imports this module
+        context_chunks = pack_context(user_query, context_chunks)["chunks"]
+    prompt = build_prompt(user_query, context_chunks)
     if config.LLM_BACKEND == "ollama":
-        # Use Ollama server
+        # Use Ollama server; with "stream": true it sends one JSON object per line
+        streamed = False
         try:
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={
-                    "model": config.OLLAMA_MODEL,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {"num_predict": 128}
-                },
-                timeout=120
-            )
-            response.raise_for_status()
-            result = response.json()
-            output = result.get("response", "")
+            with get_ollama_session().post(
+                config.OLLAMA_URL + "/api/generate",
+                json=ollama_payload(prompt),
+                stream=True,
+                timeout=config.OLLAMA_TIMEOUT
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(chunk_size=None):  # Yield each line as it arrives
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise requests.exceptions.RequestException(data["error"])
+                    if data.get("response"):
+                        streamed = True
+                        yield data["response"]
         except requests.exceptions.RequestException as e:
             print(f"[ERROR] Ollama API call failed: {e}")
-            output = "I apologize, but I'm unable to generate a response at the moment. Please check if Ollama is running and the model is available."
+            if not streamed:  # Otherwise keep the partial answer
+                yield UNAVAILABLE_MESSAGE
     else:
         llm = get_llm()
-        output = llm(prompt, max_new_tokens=128, stop=["\n"])
-    return {"text": output.strip(), "sources": sources} 
\ No newline at end of file
+        yield from llm(prompt, max_new_tokens=config.LLM_MAX_NEW_TOKENS, stop=["\n"], stream=True)
+
+def generate_answer(user_query, context_chunks):
+    output = "".join(stream_answer(user_query, context_chunks))
+    return {"text": output.strip(), "sources": get_sources(context_chunks)}
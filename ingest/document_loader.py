@@ -1,87 +1,190 @@
+import multiprocessing
 import os
-from typing import List, Dict, Union
+from typing import List, Dict, Iterable, Iterator, Union
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 from pypdf import PdfReader
 from docx import Document
 import io
+import tempfile
+import config
 
-def load_documents(data_dir: str) -> List[Dict]:
+
+def _open_source(source):
+    # Workers receive either a file path or the raw bytes of an uploaded file
+    return source if isinstance(source, str) else io.BytesIO(source)
+
+
+def _pdf_page_docs(source, fname: str, start: int = 0, end: int = None) -> List[Dict]:
+    reader = PdfReader(_open_source(source))
+    total_pages = len(reader.pages)
+    end = total_pages if end is None else min(end, total_pages)
     docs = []
-    for fname in os.listdir(data_dir):
-        fpath = os.path.join(data_dir, fname)
-        if fname.lower().endswith(".pdf"):
-            reader = PdfReader(fpath)
-            total_pages = len(reader.pages)
-            for i, page in enumerate(reader.pages):
-                text = page.extract_text()
-                if text:
-                    docs.append({
-                        "text": text,
-                        "filename": fname,
-                        "page": i + 1,
-                        "total_pages": total_pages
-                    })
-        elif fname.lower().endswith(".docx"):
-            doc = Document(fpath)
-            paragraphs = [para.text.strip() for para in doc.paragraphs if para.text.strip()]
+    for i in range(start, end):
+        text = reader.pages[i].extract_text()
+        if text:
             docs.append({
-                "text": "\n".join(paragraphs),
+                "text": text,
                 "filename": fname,
-                "paragraphs": paragraphs  # Keep for chunking
-                # Do NOT set 'page' for DOCX
+                "page": i + 1,
+                "total_pages": total_pages
             })
     return docs
 
 
-def load_uploaded_documents(uploaded_files: List) -> List[Dict]:
+def _docx_docs(source, fname: str) -> List[Dict]:
+    doc = Document(_open_source(source))
+    paragraphs = [para.text.strip() for para in doc.paragraphs if para.text.strip()]
+    return [{
+        "text": "\n".join(paragraphs),
+        "filename": fname,
+        "paragraphs": paragraphs  # Keep for chunking
+        # Do NOT set 'page' for DOCX
+    }]
+
+
+def _txt_docs(data: bytes, fname: str) -> List[Dict]:
+    txt_content = data.decode('utf-8')
+    return [{
+        "text": txt_content,
+        "filename": fname,
+        "paragraphs": txt_content.split('\n')
+    }]
+
+
+def _parse_task(task) -> List[Dict]:
+    kind, source, fname, start, end = task
+    if kind == "pdf":
+        return _pdf_page_docs(source, fname, start, end)
+    if kind == "docx":
+        return _docx_docs(source, fname)
+    return _txt_docs(source, fname)
+
+
+def _parse_task_safe(task):
+    try:
+        return _parse_task(task)
+    except Exception as e:
+        print(f"Error processing {task[2]}: {str(e)}")
+        return []
+
+
+def _pdf_tasks(source, fname: str, pages_per_task: int):
+    # Split large PDFs into page ranges so their pages are extracted on several cores
+    total_pages = len(PdfReader(_open_source(source)).pages)
+    if total_pages <= pages_per_task:
+        return [("pdf", source, fname, 0, None)]
+    return [("pdf", source, fname, start, start + pages_per_task)
+            for start in range(0, total_pages, pages_per_task)]
+
+
+def resolve_loader_workers(workers: int = None) -> int:
+    workers = config.LOADER_WORKERS if workers is None else workers
+    return workers if workers and workers > 0 else (os.cpu_count() or 1)
+
+
+def _iter_tasks(tasks, workers: int, skip_errors: bool) -> Iterator[Dict]:
+    parse = _parse_task_safe if skip_errors else _parse_task
+    tasks = iter(tasks)
+    head = list(islice(tasks, 2))
+    if workers <= 1 or len(head) <= 1:
+        for task in chain(head, tasks):
+            yield from parse(task)
+        return
+    # Keep a bounded window of tasks in flight and yield in submission order,
+    # so output order matches the serial loader and memory does not grow with the corpus
+    # spawn, not fork: the app process runs Streamlit, Qdrant and model threads, and forking
+    # a multi-threaded process can leave a worker stuck on a lock copied mid-use
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = deque()
+        for task in chain(head, tasks):
+            pending.append(executor.submit(parse, task))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def iter_documents(data_dir: str, workers: int = None, filenames: Iterable[str] = None) -> Iterator[Dict]:
+    workers = resolve_loader_workers(workers)
+    names = sorted(os.listdir(data_dir)) if filenames is None else filenames
+
+    def tasks():
+        for fname in names:
+            fpath = os.path.join(data_dir, fname)
+            if fname.lower().endswith(".pdf"):
+                yield from _pdf_tasks(fpath, fname, config.PDF_PAGES_PER_TASK) if workers > 1 else [("pdf", fpath, fname, 0, None)]
+            elif fname.lower().endswith(".docx"):
+                yield ("docx", fpath, fname, 0, None)
+
+    yield from _iter_tasks(tasks(), workers, skip_errors=False)
+
+
+def iter_uploaded_documents(uploaded_files: List, workers: int = None) -> Iterator[Dict]:
+    """
+    Lazily load documents from Streamlit uploaded files
+    """
+    workers = resolve_loader_workers(workers)
+
+    def tasks(spill_dir):
+        for n, uploaded_file in enumerate(uploaded_files):
+            fname = uploaded_file.name
+            try:
+                data = uploaded_file.read()
+                if fname.lower().endswith(".pdf"):
+                    source = data
+                    if workers > 1 and len(data) > config.PDF_SPILL_BYTES:
+                        # Hand large PDFs to workers by path instead of pickling the bytes once per page range
+                        source = os.path.join(spill_dir, f"{n}.pdf")
+                        with open(source, "wb") as f:
+                            f.write(data)
+                    file_tasks = _pdf_tasks(source, fname, config.PDF_PAGES_PER_TASK) if workers > 1 else [("pdf", source, fname, 0, None)]
+                elif fname.lower().endswith(".docx"):
+                    file_tasks = [("docx", data, fname, 0, None)]
+                elif fname.lower().endswith(".txt"):
+                    file_tasks = [("txt", data, fname, 0, None)]
+                else:
+                    file_tasks = []
+            except Exception as e:
+                print(f"Error processing {fname}: {str(e)}")
+                continue
+            yield from file_tasks
+
+    with tempfile.TemporaryDirectory() as spill_dir:
+        yield from _iter_tasks(tasks(spill_dir), workers, skip_errors=True)
+
+
+def load_documents(data_dir: str, workers: int = None) -> List[Dict]:
+    return list(iter_documents(data_dir, workers))
+
+
+def load_uploaded_documents(uploaded_files: List, workers: int = None) -> List[Dict]:
     """
     Load documents from Streamlit uploaded files
     """
-    docs = []
-    for uploaded_file in uploaded_files:
-        fname = uploaded_file.name
-        try:
-            if fname.lower().endswith(".pdf"):
-                # Read PDF from bytes
-                pdf_bytes = uploaded_file.read()
-                reader = PdfReader(io.BytesIO(pdf_bytes))
-                total_pages = len(reader.pages)
-                for i, page in enumerate(reader.pages):
-                    text = page.extract_text()
-                    if text:
-                        docs.append({
-                            "text": text,
-                            "filename": fname,
-                            "page": i + 1,
-                            "total_pages": total_pages
-                        })
-            elif fname.lower().endswith(".docx"):
-                # Read DOCX from bytes
-                docx_bytes = uploaded_file.read()
-                doc = Document(io.BytesIO(docx_bytes))
-                paragraphs = [para.text.strip() for para in doc.paragraphs if para.text.strip()]
-                docs.append({
-                    "text": "\n".join(paragraphs),
-                    "filename": fname,
-                    "paragraphs": paragraphs
-                })
-            elif fname.lower().endswith(".txt"):
-                # Read TXT from bytes
-                txt_content = uploaded_file.read().decode('utf-8')
-                docs.append({
-                    "text": txt_content,
-                    "filename": fname,
-                    "paragraphs": txt_content.split('\n')
-                })
-        except Exception as e:
-            print(f"Error processing {fname}: {str(e)}")
-            continue
-    return docs
+    return list(iter_uploaded_documents(uploaded_files, workers))
+
+
+# Bump whenever iter_chunks produces different chunks or metadata for the same input,
+# so incremental ingest re-chunks files that have not changed themselves
+CHUNKER_VERSION = 2
 
 
 def chunk_documents(docs: List[Dict], chunk_size: int = 500, overlap: int = 50) -> List[Dict]:
-    chunks = []
-    global_chunk_id = 0
+    return list(iter_chunks(docs, chunk_size, overlap))
+
+
+def iter_chunks(docs: Iterable[Dict], chunk_size: int = 500, overlap: int = 50) -> Iterator[Dict]:
+    """
+    Split documents into windows of chunk_size words overlapping by overlap words.
+    'chunk_id' counts the chunks of each file, so editing one file never renumbers another;
+    'window' is the chunk's index within its text stream (a PDF page, or a whole DOCX/TXT file):
+    consecutive windows of the same stream overlap by exactly overlap words.
+    """
+    file_chunk_ids = {}
     for doc in docs:
+        chunk_id = file_chunk_ids.get(doc["filename"], 0)
         if "paragraphs" in doc:  # DOCX
             words = []
             para_indices = []
@@ -90,6 +193,7 @@ def chunk_documents(docs: List[Dict], chunk_size: int = 500, overlap: int = 50)
                 words.extend(para_words)
                 para_indices.extend([i+1] * len(para_words))  # 1-based paragraph numbers
             start = 0
+            window = 0
             while start < len(words):
                 end = min(start + chunk_size, len(words))
                 chunk_words = words[start:end]
@@ -100,33 +204,38 @@ def chunk_documents(docs: List[Dict], chunk_size: int = 500, overlap: int = 50)
                     source_ref = f"Paragraph: {list(para_range)[0]}"
                 else:
                     source_ref = f"Paragraphs: {min(para_range)}-{max(para_range)}"
-                chunks.append({
+                yield {
                     "chunk_text": chunk_text,
                     "filename": doc["filename"],
-                    "chunk_id": global_chunk_id,
-                    "page": global_chunk_id + 1,  # Add this line for DOCX/TXT
+                    "chunk_id": chunk_id,
+                    "window": window,
+                    "page": window + 1,  # DOCX has no pages; number the chunks instead
                     "source_ref": source_ref
                     # Do NOT set 'total_pages' for DOCX
-                })
-                global_chunk_id += 1
+                }
+                chunk_id += 1
+                window += 1
                 start += chunk_size - overlap
         else:
             # PDF logic
             text = doc["text"]
             words = text.split()
             start = 0
+            window = 0
             while start < len(words):
                 end = min(start + chunk_size, len(words))
                 chunk_words = words[start:end]
                 chunk_text = " ".join(chunk_words)
-                chunks.append({
+                yield {
                     "chunk_text": chunk_text,
                     "filename": doc["filename"],
                     "page": doc["page"],
                     "total_pages": doc.get("total_pages"),
-                    "chunk_id": global_chunk_id,
+                    "chunk_id": chunk_id,
+                    "window": window,
                     "source_ref": f"Page: {doc['page']}"
-                })
-                global_chunk_id += 1
+                }
+                chunk_id += 1
+                window += 1
                 start += chunk_size - overlap
-    return chunks
\ No newline at end of file
+        file_chunk_ids[doc["filename"]] = chunk_id
\ No newline at end of file
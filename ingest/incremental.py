@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from typing import Dict, Iterable, Iterator
+import config
+from ingest.document_loader import iter_documents, iter_uploaded_documents, iter_chunks, CHUNKER_VERSION
+from ingest.pipeline import run_ingest_pipeline
+
+# Fixed namespace so the same chunk always maps to the same Qdrant point id
+POINT_ID_NAMESPACE = uuid.UUID("5b0f3c1e-8a4f-4e7b-9d36-0c2f6f1b7a52")
+
+# The app shares one vector store across sessions, and rebuild/upsert state lives on it,
+# so only one sync may run at a time per process
+_ingest_lock = threading.Lock()
+
+
+def file_fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_fingerprint_path(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_fingerprint(chunk: Dict) -> str:
+    # Metadata is part of the fingerprint: a chunk that moved to another page must be re-upserted
+    key = "\x1f".join(str(chunk.get(k)) for k in ("filename", "page", "window", "total_pages", "source_ref", "chunk_text"))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def assign_point_ids(chunks: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Give every chunk a deterministic 'point_id' derived from its content.
+    Identical chunks within one file are told apart by their occurrence number.
+    """
+    seen = {}
+    for chunk in chunks:
+        chunk_hash = chunk_fingerprint(chunk)
+        occurrence = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = occurrence + 1
+        chunk["point_id"] = str(uuid.uuid5(POINT_ID_NAMESPACE, f"{chunk_hash}:{occurrence}"))
+        yield chunk
+
+
+class IngestManifest:
+    """
+    Records, per indexed file, its content hash and the point ids of its chunks,
+    and the chunking settings those chunks were made with.
+    """
+    def __init__(self, path=None):
+        self.path = path or config.INGEST_MANIFEST_PATH
+        self.collection = None
+        self.chunking = None
+        self.files = {}
+
+    @classmethod
+    def load(cls, path=None):
+        manifest = cls(path)
+        if os.path.exists(manifest.path):
+            try:
+                with open(manifest.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                manifest.collection = data.get("collection")
+                manifest.chunking = data.get("chunking")
+                manifest.files = data.get("files", {})
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Ignoring unreadable ingest manifest {manifest.path}: {e}")
+        return manifest
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"collection": self.collection, "chunking": self.chunking, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.files = {}
+
+    def invalidate(self):
+        # Every file counts as changed on the next sync, but its point ids are kept so they get replaced
+        for entry in self.files.values():
+            entry["sha256"] = None
+
+    def file_hash(self, filename):
+        return self.files.get(filename, {}).get("sha256")
+
+    def point_ids(self, filename):
+        return self.files.get(filename, {}).get("point_ids", [])
+
+
+def _sync(vectorstore, current_hashes, load_changed, rebuild, chunk_size, overlap, embed_workers):
+    with _ingest_lock:
+        return _sync_locked(vectorstore, current_hashes, load_changed, rebuild, chunk_size, overlap, embed_workers)
+
+
+def _sync_locked(vectorstore, current_hashes, load_changed, rebuild, chunk_size, overlap, embed_workers):
+    chunk_size = chunk_size or config.CHUNK_SIZE
+    overlap = config.CHUNK_OVERLAP if overlap is None else overlap
+    chunking = {"chunk_size": chunk_size, "overlap": overlap, "version": CHUNKER_VERSION}
+    manifest = IngestManifest.load()
+    if rebuild:
+        # Built next to the live index and swapped in at the end, so searches keep working meanwhile
+        vectorstore.begin_rebuild()
+        manifest.clear()
+    elif vectorstore.ensure_collection() or manifest.collection != vectorstore.name:
+        # The collection was (re)created behind our back, so nothing recorded is indexed anymore
+        manifest.clear()
+    manifest.collection = vectorstore.name
+    if manifest.chunking != chunking:
+        # Chunks made with other settings or an older chunker: re-chunk everything, replacing the old points
+        manifest.invalidate()
+        manifest.chunking = chunking
+
+    changed = [name for name, sha in current_hashes.items() if manifest.file_hash(name) != sha]
+    removed = [name for name in manifest.files if name not in current_hashes]
+    old_ids_by_file = {name: set(manifest.point_ids(name)) for name in changed}
+    new_ids_by_file = {name: [] for name in changed}
+
+    def needs_embedding(chunk):
+        new_ids_by_file[chunk["filename"]].append(chunk["point_id"])
+        return chunk["point_id"] not in old_ids_by_file[chunk["filename"]]
+
+    try:
+        # Chunks stream through the pipeline; only their ids are kept for the manifest
+        chunks = assign_point_ids(iter_chunks(load_changed(changed), chunk_size, overlap))
+        pipeline_stats = run_ingest_pipeline((c for c in chunks if needs_embedding(c)), vectorstore,
+                                             embed_workers=embed_workers)
+
+        stale_ids = []
+        for name in changed:
+            stale_ids.extend(old_ids_by_file[name] - set(new_ids_by_file[name]))
+        for name in removed:
+            stale_ids.extend(manifest.point_ids(name))
+        vectorstore.delete_points(stale_ids)
+    except BaseException:
+        if rebuild:
+            vectorstore.abort_rebuild()
+        else:
+            # Some new chunks may already be stored: record them with the old ones and keep the
+            # files marked as changed, so the next sync deletes whatever it doesn't produce again
+            for name in changed:
+                point_ids = list(old_ids_by_file[name]) + [p for p in new_ids_by_file[name]
+                                                          if p not in old_ids_by_file[name]]
+                manifest.files[name] = {"sha256": None, "point_ids": point_ids}
+            manifest.save()
+        raise
+    if rebuild:
+        vectorstore.finish_rebuild()
+
+    for name in changed:
+        manifest.files[name] = {"sha256": current_hashes[name], "point_ids": new_ids_by_file[name]}
+    for name in removed:
+        del manifest.files[name]
+    manifest.save()
+
+    return {
+        "files_changed": len(changed),
+        "files_unchanged": len(current_hashes) - len(changed),
+        "files_removed": len(removed),
+        "chunks_embedded": pipeline_stats["chunks_embedded"],
+        "chunks_deleted": len(stale_ids),
+    }
+
+
+def sync_uploaded_documents(vectorstore, uploaded_files, rebuild=False, chunk_size=None, overlap=None, embed_workers=None):
+    """
+    Bring the collection in line with uploaded_files, touching only what changed.
+    Unchanged files are skipped, new chunks of changed files are embedded and upserted,
+    and chunks belonging to modified or removed files are deleted.
+    Chunking defaults to CHUNK_SIZE/CHUNK_OVERLAP words, which the context packer relies on.
+    Returns a dict of counters for display.
+    """
+    files_by_name = {f.name: f for f in uploaded_files}
+    current_hashes = {name: file_fingerprint(f.getvalue()) for name, f in files_by_name.items()}
+
+    def load_changed(names):
+        files = [files_by_name[name] for name in names]
+        for f in files:
+            f.seek(0)  # Uploaded files may already have been read by an earlier run
+        return iter_uploaded_documents(files)
+
+    return _sync(vectorstore, current_hashes, load_changed, rebuild, chunk_size, overlap, embed_workers)
+
+
+def sync_directory(vectorstore, data_dir, rebuild=False, chunk_size=None, overlap=None, embed_workers=None):
+    """
+    Same as sync_uploaded_documents, for the PDF/DOCX files in a directory.
+    """
+    names = [name for name in sorted(os.listdir(data_dir)) if name.lower().endswith((".pdf", ".docx"))]
+    current_hashes = {name: file_fingerprint_path(os.path.join(data_dir, name)) for name in names}
+    return _sync(vectorstore, current_hashes, lambda changed: iter_documents(data_dir, filenames=changed),
+                 rebuild, chunk_size, overlap, embed_workers)
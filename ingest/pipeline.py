@@ -0,0 +1,136 @@
+import argparse
+import queue
+import threading
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+import config
+from retrieval.embedder import embed_chunks
+from retrieval.embed_pool import EmbeddingPool, plan_embed_workers
+
+_DONE = object()
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _put(q, item, stop):
+    # Give up instead of blocking forever once another stage has failed
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(q, stop):
+    while True:
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _stage(target, outbox, stop, errors):
+    def run():
+        try:
+            target()
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(outbox, _DONE, stop)
+    return threading.Thread(target=run, daemon=True)
+
+
+def run_ingest_pipeline(chunks: Iterable[Dict], vectorstore, batch_size: int = None, queue_size: int = None,
+                        embed_workers: int = None) -> Dict:
+    """
+    Embed and upsert chunks in bounded batches with the stages running concurrently:
+    loading/chunking (whatever drives the chunks iterable) -> embedding -> upsert.
+    Only queue_size batches are buffered between stages, so memory stays flat with corpus size.
+    embed_workers > 1 (or 0 for auto) embeds on a pool of worker processes.
+    Chunks must already carry a 'point_id'.
+    """
+    batch_size = batch_size or config.INGEST_BATCH_SIZE
+    queue_size = queue_size or config.INGEST_QUEUE_SIZE
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    embedded_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        for batch in iter_batches(chunks, batch_size):
+            if not _put(chunk_queue, batch, stop):
+                return
+
+    def embed():
+        batches = _drain(chunk_queue, stop)
+        if plan_embed_workers(embed_workers)[0] <= 1:
+            results = ((batch, embed_chunks(batch)) for batch in batches)
+            pool = None
+        else:
+            pool = EmbeddingPool(embed_workers)
+            results = pool.embed_batches(batches)
+        try:
+            for result in results:
+                if not _put(embedded_queue, result, stop):
+                    return
+        finally:
+            if pool is not None:
+                pool.close()
+
+    stages = [_stage(produce, chunk_queue, stop, errors), _stage(embed, embedded_queue, stop, errors)]
+    for stage in stages:
+        stage.start()
+
+    stats = {"batches": 0, "chunks_embedded": 0}
+    try:
+        for batch, embeddings in _drain(embedded_queue, stop):
+            # Don't wait for the upsert: the next batch is embedded while this one is in flight
+            vectorstore.add_embeddings(embeddings, batch, flush=False)
+            stats["batches"] += 1
+            stats["chunks_embedded"] += len(batch)
+        vectorstore.flush()
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for stage in stages:
+            stage.join()
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def main():
+    # Local import: ingest.incremental builds on this module
+    from ingest.incremental import sync_directory
+    from retrieval.base import get_vectorstore
+
+    parser = argparse.ArgumentParser(description="Index a directory of documents into the vector store")
+    parser.add_argument("--data-dir", default=config.DATA_DIR)
+    parser.add_argument("--rebuild", action="store_true", help="Drop the collection and re-embed everything")
+    parser.add_argument("--embed-workers", type=int, default=config.EMBED_WORKERS,
+                        help="Embedding processes; 0 = auto from cores and free memory, 1 = in-process")
+    args = parser.parse_args()
+
+    stats = sync_directory(get_vectorstore(), args.data_dir, rebuild=args.rebuild or not config.INCREMENTAL_INGEST,
+                           embed_workers=args.embed_workers)
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from retrieval.bm25 import reciprocal_rank_fusion
+from retrieval.embedder import get_embedder, embedding_model_id
+from retrieval.embedding_cache import text_key
+from retrieval.mmr import mmr_select
+from utils.lru_cache import LRUCache
+import config
+
+# Shared by all stores in the process: repeated questions skip model inference
+query_cache = LRUCache(maxsize=config.QUERY_CACHE_SIZE, ttl=config.QUERY_CACHE_TTL)
+
+def embed_queries(queries):
+    """Normalized embeddings for a list of queries; cache misses are encoded in one batch."""
+    # Use the same embedder as in embedder.py for consistency
+    model_id = embedding_model_id()
+    keys = [(model_id, text_key(query)) for query in queries]
+    query_embs = [query_cache.get(key) for key in keys]
+    missing = [i for i, query_emb in enumerate(query_embs) if query_emb is None]
+    if missing:
+        encoded = get_embedder().encode([queries[i] for i in missing], batch_size=config.EMBED_BATCH_SIZE,
+                                        show_progress_bar=False, normalize_embeddings=True)
+        for i, query_emb in zip(missing, encoded):
+            query_embs[i] = query_emb
+            query_cache.put(keys[i], query_emb)
+    return query_embs
+
+def embed_query(query):
+    return embed_queries([query])[0]
+
+# Runs the dense leg of hybrid searches while the calling thread scores BM25
+_search_executor = ThreadPoolExecutor(max_workers=config.HYBRID_SEARCH_THREADS, thread_name_prefix="dense-search")
+
+
+class VectorStore(ABC):
+    """
+    What the ingest pipeline and the app need from a vector store backend.
+    Chunks are dicts as produced by chunk_documents (optionally with a 'point_id').
+    """
+
+    @property
+    @abstractmethod
+    def name(self):
+        """Identifies the underlying index, e.g. to tell whether an ingest manifest belongs to it."""
+
+    @abstractmethod
+    def reset_collection(self):
+        """Drop everything and start from an empty index."""
+
+    @abstractmethod
+    def ensure_collection(self):
+        """Create the index if missing. Returns True when a new (empty) index was created."""
+
+    def index_version(self):
+        """Changes whenever the live index is replaced (rebuild/reset), e.g. to invalidate caches."""
+        return self.name
+
+    def begin_rebuild(self):
+        """
+        Start filling a fresh index. Until finish_rebuild(), writes go to the new index
+        while searches keep using the current one.
+        """
+        self.reset_collection()
+
+    def finish_rebuild(self):
+        """Make the index built since begin_rebuild() the live one."""
+        self.flush()
+
+    def abort_rebuild(self):
+        """Throw away a partially built index; the live one is untouched."""
+
+    @abstractmethod
+    def add_embeddings(self, embeddings, chunks, flush=True):
+        """Insert or overwrite points; with flush=False writes may be deferred until flush()."""
+
+    @abstractmethod
+    def flush(self):
+        """Block until every added point is stored and searchable."""
+
+    @abstractmethod
+    def delete_points(self, point_ids):
+        """Remove points by id; unknown ids are ignored."""
+
+    @abstractmethod
+    def dense_search_many(self, query_embs, top_k=3, filenames=None, pages=None, with_vectors=False,
+                          **search_params):
+        """
+        For each query embedding, the top_k most similar chunk dicts (with their 'point_id'),
+        optionally only from the given files and pages (an iterable or a range()).
+        with_vectors=True adds each chunk's stored embedding as 'vector'.
+        search_params are backend-specific tuning knobs (Qdrant: hnsw_ef, exact); others ignore them.
+        """
+
+    @abstractmethod
+    def get_chunks(self, point_ids, with_vectors=False):
+        """Chunk dicts by point id, as {point_id: chunk}; unknown ids are left out."""
+
+    def lexical_index(self):
+        """The BM25Index kept next to the live index, or None when hybrid search is off."""
+        return None
+
+    def search(self, query, top_k=3, filenames=None, pages=None, mode=None, mmr=None, mmr_lambda=None,
+               **search_params):
+        """
+        Return the top_k chunk dicts most relevant to the query text.
+        mode: "dense" or "hybrid" (dense + BM25 fused with reciprocal-rank fusion);
+        defaults to SEARCH_MODE. Falls back to dense when the store has no lexical index.
+        mmr: pick the top_k out of MMR_FETCH_K candidates by maximal marginal relevance,
+        skipping near-duplicates (defaults to MMR_ENABLED; mmr_lambda to MMR_LAMBDA).
+        search_params go to the dense search, e.g. hnsw_ef=128 or exact=True on Qdrant.
+        """
+        return self.search_many([query], top_k, filenames, pages, mode, mmr, mmr_lambda, **search_params)[0]
+
+    def search_many(self, queries, top_k=3, filenames=None, pages=None, mode=None, mmr=None, mmr_lambda=None,
+                    **search_params):
+        """
+        search() for a list of queries, returning one result list per query, in order.
+        All queries are embedded in one batch and sent to the backend in one batch request.
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        mmr = config.MMR_ENABLED if mmr is None else mmr
+        fetch_k = max(top_k, config.MMR_FETCH_K) if mmr else top_k
+        query_embs = embed_queries(queries)
+        lexical = self.lexical_index() if (mode or config.SEARCH_MODE) == "hybrid" else None
+        if lexical is None:
+            results = self.dense_search_many(query_embs, fetch_k, filenames, pages, mmr, **search_params)
+        else:
+            candidates = max(fetch_k, config.HYBRID_CANDIDATES)
+            dense_future = _search_executor.submit(self.dense_search_many, query_embs, candidates, filenames, pages,
+                                                   mmr, **search_params)
+            lexical_hits = [lexical.search(query, candidates, filenames, pages) for query in queries]
+            results = [self._fuse(dense_hits, hits, fetch_k, mmr)
+                       for dense_hits, hits in zip(dense_future.result(), lexical_hits)]
+        if mmr:
+            mmr_lambda = config.MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+            results = [self._select_mmr(query_emb, chunks, top_k, mmr_lambda)
+                       for query_emb, chunks in zip(query_embs, results)]
+        return results
+
+    def _fuse(self, dense_hits, lexical_hits, top_k, with_vectors):
+        chunks = {chunk["point_id"]: chunk for chunk in dense_hits}
+        fused = reciprocal_rank_fusion(
+            [list(chunks), [point_id for point_id, _ in lexical_hits]], k=config.RRF_K
+        )[:top_k]
+        missing = [point_id for point_id in fused if point_id not in chunks]
+        if missing:
+            chunks.update(self.get_chunks(missing, with_vectors))
+        return [chunks[point_id] for point_id in fused if point_id in chunks]
+
+    @staticmethod
+    def _select_mmr(query_emb, candidates, top_k, mmr_lambda):
+        if not candidates:
+            return []
+        picked = mmr_select(query_emb, [chunk.pop("vector") for chunk in candidates], top_k, mmr_lambda)
+        return [candidates[i] for i in picked]
+
+
+def get_vectorstore():
+    # Backends are imported lazily so the embedded store does not need qdrant-client at runtime
+    if config.VECTOR_STORE_BACKEND == "local":
+        from retrieval.local_store import LocalVectorStore
+        return LocalVectorStore()
+    from retrieval.vectorstore import QdrantVectorStore
+    return QdrantVectorStore()
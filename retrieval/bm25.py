@@ -0,0 +1,133 @@
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+# Identifiers such as "XK-2291-B" or "v1.5" are kept whole *and* split into their parts,
+# so both the exact string and its pieces match.
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index over chunk texts, keyed by vector store point id,
+    persisted with pickle. Keeps filename/page per chunk so it can apply the same
+    filters as the dense search.
+    """
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {doc_id: term frequency}
+        self.docs = {}  # doc_id -> (length, filename, page, unique terms)
+        self.total_length = 0
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    @classmethod
+    def load(cls, path):
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            index = cls(path, state["k1"], state["b"])
+            index.postings, index.docs, index.total_length = state["postings"], state["docs"], state["total_length"]
+            return index
+        return cls(path)
+
+    def save(self):
+        with self._lock:
+            if not self.path or not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"k1": self.k1, "b": self.b, "postings": self.postings,
+                             "docs": self.docs, "total_length": self.total_length}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def add(self, doc_id, text, filename=None, page=None):
+        with self._lock:
+            self.remove([doc_id])
+            counts = {}
+            for token in tokenize(text):
+                counts[token] = counts.get(token, 0) + 1
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+            length = sum(counts.values())
+            self.docs[doc_id] = (length, filename, page, tuple(counts))
+            self.total_length += length
+            self.dirty = True
+
+    def remove(self, doc_ids: Iterable):
+        with self._lock:
+            for doc_id in doc_ids:
+                doc = self.docs.pop(doc_id, None)
+                if doc is None:
+                    continue
+                length, _, _, terms = doc
+                self.total_length -= length
+                for term in terms:
+                    posting = self.postings.get(term)
+                    if posting is not None:
+                        posting.pop(doc_id, None)
+                        if not posting:
+                            del self.postings[term]
+                self.dirty = True
+
+    def clear(self):
+        with self._lock:
+            self.postings, self.docs, self.total_length = {}, {}, 0
+            self.dirty = True
+
+    def search(self, query, top_k=10, filenames=None, pages=None) -> List[Tuple[object, float]]:
+        with self._lock:
+            n = len(self.docs)
+            if n == 0:
+                return []
+            avg_length = self.total_length / n
+            allowed_files = set(filenames) if filenames else None
+            allowed_pages = pages if isinstance(pages, range) else (set(int(p) for p in pages) if pages else None)
+            scores = {}
+            for term in set(tokenize(query)):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    length, filename, page, _ = self.docs[doc_id]
+                    if allowed_files is not None and filename not in allowed_files:
+                        continue
+                    if allowed_pages is not None and page not in allowed_pages:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(ranked_lists: Iterable[List], k=60) -> List:
+    """
+    Fuse ranked lists of ids: score(id) = sum over lists of 1 / (k + rank).
+    Returns ids ordered by fused score.
+    """
+    fused: Dict[object, float] = {}
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=fused.get, reverse=True)
@@ -0,0 +1,57 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable
+import config
+
+
+class ChunkDocstore:
+    """
+    Local store of chunk text and metadata keyed by point id, so Qdrant payloads
+    only need the fields searches filter on. Records are zlib-compressed JSON in a
+    memory-mapped SQLite file; search hits are fetched with one bulk read.
+    """
+    _BATCH = 500  # Stay below SQLite's bound-parameter limit
+
+    def __init__(self, path=None):
+        self.path = path or config.DOCSTORE_PATH
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA mmap_size={int(config.DOCSTORE_MMAP_BYTES)}")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID")
+        self._conn.commit()
+
+    def put_many(self, records: Dict[str, Dict]):
+        rows = [(str(point_id), zlib.compress(json.dumps(record).encode("utf-8")))
+                for point_id, record in records.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks (id, data) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def get_many(self, point_ids: Iterable) -> Dict[str, Dict]:
+        point_ids = [str(p) for p in point_ids]
+        found = {}
+        with self._lock:
+            for start in range(0, len(point_ids), self._BATCH):
+                batch = point_ids[start:start + self._BATCH]
+                rows = self._conn.execute(
+                    f"SELECT id, data FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                )
+                for point_id, blob in rows:
+                    found[point_id] = json.loads(zlib.decompress(blob))
+        return found
+
+    def delete_many(self, point_ids: Iterable):
+        rows = [(str(p),) for p in point_ids]
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", rows)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
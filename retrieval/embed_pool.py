@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import psutil
+import config
+
+
+def plan_embed_workers(workers=None):
+    """
+    Returns (worker processes, threads per worker).
+    workers=0 derives the count from physical cores and available memory,
+    since every worker holds its own copy of the model.
+    """
+    workers = config.EMBED_WORKERS if workers is None else workers
+    cores = psutil.cpu_count(logical=False) or os.cpu_count() or 1
+    if workers <= 0:
+        by_cores = max(1, cores // config.EMBED_THREADS_PER_WORKER)
+        by_memory = int(psutil.virtual_memory().available // (config.EMBED_WORKER_MEMORY_MB * 1024 * 1024))
+        workers = max(1, min(by_cores, by_memory))
+    return workers, max(1, cores // workers)
+
+
+def _init_worker(threads, core_slots):
+    # Pin each worker to its own slice of cores so workers do not oversubscribe the CPU
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    config.ONNX_INTRA_OP_THREADS = threads
+    try:
+        cores = core_slots.get_nowait()
+        if cores and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+    except Exception:
+        pass
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from retrieval.embedder import get_embedder
+    get_embedder()  # Load the model once per worker, not per batch
+
+
+def _embed_texts(texts):
+    from retrieval.embedder import embed_chunks
+    return embed_chunks([{"chunk_text": t} for t in texts])
+
+
+class EmbeddingPool:
+    """
+    Spreads embedding over worker processes, each with its own model copy.
+    Workers share the on-disk embedding cache.
+    """
+    def __init__(self, workers=None):
+        self.workers, self.threads = plan_embed_workers(workers)
+        # spawn, not fork: forking a process that already initialised torch/OpenMP can deadlock
+        context = multiprocessing.get_context("spawn")
+        core_slots = context.Queue()
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        for i in range(self.workers):
+            core_slots.put(set(available[i * self.threads:(i + 1) * self.threads]))
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context,
+            initializer=_init_worker, initargs=(self.threads, core_slots)
+        )
+
+    def embed_batches(self, batches):
+        """
+        Yields (batch, embeddings) for every chunk batch, in input order,
+        keeping a couple of batches in flight per worker.
+        """
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, self._executor.submit(_embed_texts, [c["chunk_text"] for c in batch])))
+            if len(pending) >= self.workers * 2:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
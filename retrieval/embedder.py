@@ -1,23 +1,93 @@
 from sentence_transformers import SentenceTransformer
-from retrieval.vectorstore import QdrantVectorStore
+from retrieval.embedding_cache import get_embedding_cache, text_key
 import config
 import os
+import numpy as np
 
 _model = None
+_model_id = None
+
+def sentence_transformer_source():
+    # Prefer the local copy for offline use
+    local_model_path = os.path.join(config.MODELS_DIR, "bge-small-en-v1.5")
+    if os.path.exists(local_model_path):
+        return local_model_path
+    return config.EMBEDDING_MODEL_NAME
+
+def load_sentence_transformer():
+    return SentenceTransformer(sentence_transformer_source())
 
-# Try to load embedding model from local path for offline use
 def get_embedder():
-    global _model
+    global _model, _model_id
     if _model is None:
-        local_model_path = os.path.join(config.MODELS_DIR, "bge-small-en-v1.5")
-        if os.path.exists(local_model_path):
-            _model = SentenceTransformer(local_model_path)
+        if config.EMBEDDING_BACKEND == "onnx":
+            from retrieval.onnx_embedder import OnnxEmbedder
+            _model = OnnxEmbedder()
+            _model_id = "onnx:" + _model.model_path
         else:
-            _model = SentenceTransformer(config.EMBEDDING_MODEL_NAME)
+            _model = load_sentence_transformer()
+            _model_id = "sentence-transformers:" + sentence_transformer_source()
     return _model
 
-def embed_chunks(chunks):
+def embedding_model_id():
+    # Identifies which vectors the current embedder produces, for keying the embedding cache
+    get_embedder()
+    return _model_id
+
+def _token_lengths(model, texts):
+    encoded = model.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=model.max_seq_length)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+def length_bucketed_batches(lengths, max_batch_size, max_batch_tokens):
+    """
+    Group indices into batches of similar length, longest first.
+    A batch is padded to its first (longest) item, so it is closed once
+    len(batch) * longest would exceed max_batch_tokens or it holds max_batch_size items.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    batch = []
+    for i in order:
+        if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * lengths[batch[0]] > max_batch_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _encode(texts):
     model = get_embedder()
+    if not texts:
+        return np.empty((0, config.EMBEDDING_DIM), dtype=np.float32)
+    batches = length_bucketed_batches(_token_lengths(model, texts), config.EMBED_BATCH_SIZE, config.EMBED_MAX_BATCH_TOKENS)
+    embeddings = np.empty((len(texts), config.EMBEDDING_DIM), dtype=np.float32)
+    for batch in batches:
+        # batch_size=len(batch) so encode() does not re-split what we already bucketed
+        vectors = model.encode([texts[i] for i in batch], batch_size=len(batch),
+                               show_progress_bar=False, normalize_embeddings=True)
+        embeddings[batch] = vectors  # Scatter back to the original order
+    return embeddings
+
+def embed_chunks(chunks):
     texts = [c["chunk_text"] for c in chunks]
-    embeddings = model.encode(texts, show_progress_bar=True, normalize_embeddings=True)
-    return embeddings 
\ No newline at end of file
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return _encode(texts)
+    if not texts:
+        return np.empty((0, config.EMBEDDING_DIM), dtype=np.float32)
+
+    cache = get_embedding_cache()
+    model_id = embedding_model_id()
+    keys = [text_key(t) for t in texts]
+    vectors = cache.get_many(model_id, set(keys))
+    # Encode each missing text once, even if it occurs in several chunks
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors:
+            missing.setdefault(key, text)
+    if missing:
+        encoded = _encode(list(missing.values()))
+        new_vectors = dict(zip(missing.keys(), encoded))
+        cache.put_many(model_id, new_vectors)
+        vectors.update(new_vectors)
+    return np.stack([vectors[k] for k in keys]).astype(np.float32)
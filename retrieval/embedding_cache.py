@@ -0,0 +1,68 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, Iterable
+import numpy as np
+import config
+
+
+def text_key(text: str) -> str:
+    # Whitespace and unicode form do not change the embedding, so they do not change the key either
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent SQLite store of embedding vectors keyed by (model id, text hash).
+    Lives outside the Qdrant volume so a wiped index can be rebuilt without re-encoding.
+    """
+    _BATCH = 500  # Stay below SQLite's bound-parameter limit
+
+    def __init__(self, path=None):
+        self.path = path or config.EMBEDDING_CACHE_PATH
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # Embedding worker processes share this file, so wait on locks instead of failing
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, key)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def get_many(self, model_id: str, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), self._BATCH):
+                batch = keys[start:start + self._BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [model_id, *batch]
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model_id: str, vectors: Dict[str, np.ndarray]):
+        rows = [(model_id, key, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in vectors.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+    return _cache
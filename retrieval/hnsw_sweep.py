@@ -0,0 +1,131 @@
+import argparse
+import csv
+import time
+import numpy as np
+from qdrant_client.models import HnswConfigDiff, OptimizersConfigDiff
+import config
+
+# Measures recall@k against exact search and p50/p99 latency for a grid of HNSW settings.
+#
+#   python -m retrieval.hnsw_sweep --queries questions.txt --ef 16,32,64,128,256
+#   python -m retrieval.hnsw_sweep --m 8,16,32 --ef-construct 100,200 --ef 32,64,128
+#
+# --m / --ef-construct rebuild the collection's HNSW graph in place for every combination,
+# so run it against a copy of production data; the original settings are restored at the end.
+# Collections smaller than Qdrant's indexing_threshold have no HNSW graph yet and are always
+# searched exactly. Ground truth is exact search on the original (unquantized) vectors.
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def sample_queries(store, count, words=30):
+    # Without a query file, use the opening words of stored chunks as stand-in questions
+    points, _ = store.client.scroll(collection_name=config.QDRANT_COLLECTION, limit=count, with_payload=True)
+    return [" ".join(payload["chunk_text"].split()[:words]) for payload in store.hydrate(points)]
+
+
+def wait_for_index(store, collection, timeout=3600, settle=10):
+    # Right after update_collection the status can still read green because the optimizer
+    # has not picked the change up yet: wait up to `settle` seconds to see it leave green,
+    # then for green again
+    deadline = time.time() + timeout
+    settle_until = time.time() + settle
+    started = False
+    while time.time() < deadline:
+        status = store.client.get_collection(collection).status.value
+        if status == "grey":
+            # Optimization pending but not triggered; an empty optimizer update starts it
+            store.client.update_collection(collection_name=collection, optimizers_config=OptimizersConfigDiff())
+        if status != "green":
+            started = True
+        elif started or time.time() >= settle_until:
+            return
+        time.sleep(1)
+    raise TimeoutError("Collection did not finish re-indexing in time")
+
+
+def set_hnsw(store, collection, m, ef_construct):
+    store.client.update_collection(collection_name=collection, hnsw_config=HnswConfigDiff(m=m, ef_construct=ef_construct))
+    wait_for_index(store, collection)
+
+
+def measure(store, query_vectors, truth, top_k, hnsw_ef):
+    store.search_vector(query_vectors[0], top_k, hnsw_ef=hnsw_ef)  # Warm-up, untimed
+    latencies = []
+    recalls = []
+    for vector, expected in zip(query_vectors, truth):
+        start = time.perf_counter()
+        results = store.search_vector(vector, top_k, hnsw_ef=hnsw_ef)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len({r.id for r in results} & expected) / max(len(expected), 1))
+    return {
+        "hnsw_ef": hnsw_ef,
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def sweep(store, queries, top_k=5, ef_values=(None,), m_values=(None,), ef_construct_values=(None,)):
+    from retrieval.embedder import get_embedder
+    query_vectors = get_embedder().encode(queries, normalize_embeddings=True)
+    truth = [{r.id for r in store.search_vector(v, top_k, exact=True)} for v in query_vectors]
+    collection = store.live_collection()  # Settings are per collection, not per alias
+    original = store.client.get_collection(collection).config.hnsw_config
+    rebuilt = False
+    rows = []
+    try:
+        for m in m_values:
+            for ef_construct in ef_construct_values:
+                if m is not None or ef_construct is not None:
+                    set_hnsw(store, collection, m, ef_construct)
+                    rebuilt = True
+                for ef in ef_values:
+                    row = {"m": m, "ef_construct": ef_construct}
+                    row.update(measure(store, query_vectors, truth, top_k, ef))
+                    rows.append(row)
+                    print(f"m={m} ef_construct={ef_construct} hnsw_ef={ef}: recall@{top_k}={row['recall']:.4f} "
+                          f"p50={row['p50_ms']:.2f}ms p99={row['p99_ms']:.2f}ms")
+    finally:
+        if rebuilt:
+            print(f"Restoring m={original.m} ef_construct={original.ef_construct}")
+            set_hnsw(store, collection, original.m, original.ef_construct)
+    return rows
+
+
+def main():
+    from retrieval.vectorstore import QdrantVectorStore
+
+    parser = argparse.ArgumentParser(description="HNSW recall/latency sweep for a Qdrant collection")
+    parser.add_argument("--collection", default=config.QDRANT_COLLECTION)
+    parser.add_argument("--queries", help="Text file with one query per line (default: sample stored chunks)")
+    parser.add_argument("--sample", type=int, default=200, help="Queries to sample when --queries is not given")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--ef", type=_int_list, default=[16, 32, 64, 128, 256], help="Query-time hnsw_ef values")
+    parser.add_argument("--m", type=_int_list, default=[None], help="HNSW m values (rebuilds the graph)")
+    parser.add_argument("--ef-construct", type=_int_list, default=[None], help="HNSW ef_construct values (rebuilds the graph)")
+    parser.add_argument("--csv", help="Also write the results to this CSV file")
+    args = parser.parse_args()
+
+    config.QDRANT_COLLECTION = args.collection
+    store = QdrantVectorStore()
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = sample_queries(store, args.sample)
+    if not queries:
+        raise SystemExit("No queries to run")
+
+    rows = sweep(store, queries, args.top_k, args.ef, args.m, args.ef_construct)
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from retrieval.base import VectorStore
+from retrieval.bm25 import BM25Index
+import config
+
+# Embedded, in-process vector store: exact cosine search over a memory-mapped matrix.
+# Good for corpora up to a few hundred thousand chunks without running a Qdrant server.
+#
+# On-disk layout (LOCAL_INDEX_DIR):
+#   vectors.npy     normalized vectors, capacity rows of which the first `count` are used
+#   index.json      {"dim", "dtype", "count", "created"}
+#   payloads.jsonl  one {"id", "payload"} line per used row, in row order
+#   bm25.pkl        BM25 index of the chunk texts (SEARCH_MODE = "hybrid" only)
+
+
+class LocalVectorStore(VectorStore):
+    _SEARCH_BLOCK = 65536  # Rows scored per matmul; bounds the float32 copy made for float16 storage
+    _QUERY_BLOCK = 64  # Queries scored together by search_many; bounds the rows x queries score matrix
+
+    def __init__(self, index_dir=None):
+        self.index_dir = index_dir or config.LOCAL_INDEX_DIR
+        self.dtype = np.dtype(config.LOCAL_VECTOR_DTYPE)
+        self._lock = threading.RLock()
+        self._vectors = None
+        self._count = 0
+        self._created = None  # Set when the index is (re)created; identifies the index version
+        self._ids = []
+        self._payloads = []
+        self._rows = {}
+        self._deleted = set()
+        self._filename_rows = None  # filename -> row numbers, rebuilt lazily after writes
+        self._staging = None  # Store being filled by a rebuild; searches keep using this one meanwhile
+        self._lexical = None
+        if os.path.exists(self._path("index.json")):
+            self._load()
+
+    @property
+    def name(self):
+        return "local:" + os.path.abspath(self.index_dir)
+
+    def _path(self, filename):
+        return os.path.join(self.index_dir, filename)
+
+    def _load(self):
+        with open(self._path("index.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self.dtype = np.dtype(info["dtype"])
+        self._count = info["count"]
+        self._created = info.get("created")
+        self._vectors = np.load(self._path("vectors.npy"), mmap_mode="r+")
+        self._ids = []
+        self._payloads = []
+        with open(self._path("payloads.jsonl"), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self._ids.append(record["id"])
+                self._payloads.append(record["payload"])
+        self._rows = {point_id: row for row, point_id in enumerate(self._ids)}
+        self._deleted = set()
+
+    def index_version(self):
+        return f"{self.name}@{self._created}"
+
+    def lexical_index(self):
+        if config.SEARCH_MODE != "hybrid":
+            return None
+        if self._lexical is None:
+            self._lexical = BM25Index.load(self._path("bm25.pkl"))
+        return self._lexical
+
+    def _allocate(self, capacity):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = self._path("vectors.npy.tmp")
+        vectors = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype,
+                                            shape=(capacity, config.EMBEDDING_DIM))
+        if self._count:
+            vectors[:self._count] = self._vectors[:self._count]
+        vectors.flush()
+        del vectors
+        self._vectors = None
+        os.replace(tmp_path, self._path("vectors.npy"))
+        self._vectors = np.load(self._path("vectors.npy"), mmap_mode="r+")
+
+    def reset_collection(self):
+        with self._lock:
+            self._vectors = None
+            if os.path.exists(self.index_dir):
+                shutil.rmtree(self.index_dir)
+            self._count = 0
+            self._created = time.time()
+            self._ids, self._payloads, self._rows, self._deleted = [], [], {}, set()
+            self._filename_rows = None
+            self._lexical = None
+            self._allocate(1024)
+            self.flush()
+
+    def ensure_collection(self):
+        with self._lock:
+            if self._vectors is not None:
+                return False
+            self.reset_collection()
+            return True
+
+    def begin_rebuild(self):
+        with self._lock:
+            self._staging = LocalVectorStore(self.index_dir + ".staging")
+            self._staging.reset_collection()
+
+    def finish_rebuild(self):
+        with self._lock:
+            staging, self._staging = self._staging, None
+            staging.flush()
+            staging._vectors = None  # Release the memory maps before moving the files
+            self._vectors = None
+            old_dir = self.index_dir + ".old"
+            shutil.rmtree(old_dir, ignore_errors=True)
+            if os.path.exists(self.index_dir):
+                os.replace(self.index_dir, old_dir)
+            os.replace(staging.index_dir, self.index_dir)
+            self._load()
+            self._filename_rows = None
+            self._lexical = None  # Reloaded from the new directory on next use
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    def abort_rebuild(self):
+        with self._lock:
+            if self._staging is not None:
+                self._staging._vectors = None
+                shutil.rmtree(self._staging.index_dir, ignore_errors=True)
+                self._staging = None
+
+    def add_embeddings(self, embeddings, chunks, flush=True):
+        if self._staging is not None:
+            return self._staging.add_embeddings(embeddings, chunks, flush)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(embeddings):
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        with self._lock:
+            if self._vectors is None:
+                self.ensure_collection()
+            lexical = self.lexical_index()
+            for i, (emb, meta) in enumerate(zip(embeddings, chunks)):
+                point_id = meta.get("point_id", i)
+                payload = {
+                    "filename": meta["filename"],
+                    "page": meta.get("page"),
+                    "total_pages": meta.get("total_pages"),
+                    "chunk_id": meta["chunk_id"],
+                    "window": meta.get("window"),
+                    "chunk_text": meta["chunk_text"],
+                    "source_ref": meta.get("source_ref")
+                }
+                row = self._rows.get(point_id)
+                if row is None:
+                    if self._count == len(self._vectors):
+                        self._allocate(len(self._vectors) * 2)
+                    row = self._count
+                    self._count += 1
+                    self._ids.append(point_id)
+                    self._payloads.append(payload)
+                    self._rows[point_id] = row
+                else:
+                    self._payloads[row] = payload
+                    self._deleted.discard(row)
+                self._vectors[row] = emb
+                if lexical is not None:
+                    lexical.add(point_id, payload["chunk_text"], payload["filename"], payload["page"])
+            self._filename_rows = None
+            if flush:
+                self.flush()
+
+    def delete_points(self, point_ids):
+        if self._staging is not None:
+            return self._staging.delete_points(point_ids)
+        point_ids = list(point_ids)
+        with self._lock:
+            for point_id in point_ids:
+                row = self._rows.pop(point_id, None)
+                if row is not None:
+                    self._deleted.add(row)
+            lexical = self.lexical_index()
+            if lexical is not None:
+                lexical.remove(point_ids)
+            self.flush()
+
+    def _compact(self):
+        # Move live rows down over deleted ones, in place in the memory map
+        keep = np.array([row for row in range(self._count) if row not in self._deleted], dtype=np.int64)
+        if len(keep):
+            self._vectors[:len(keep)] = self._vectors[keep]
+        self._ids = [self._ids[row] for row in keep]
+        self._payloads = [self._payloads[row] for row in keep]
+        self._count = len(keep)
+        self._rows = {point_id: row for row, point_id in enumerate(self._ids)}
+        self._deleted = set()
+        self._filename_rows = None
+
+    def _candidate_rows(self, filenames, pages):
+        if self._filename_rows is None:
+            by_file = {}
+            for row in range(self._count):
+                by_file.setdefault(self._payloads[row]["filename"], []).append(row)
+            self._filename_rows = {name: np.array(rows, dtype=np.int64) for name, rows in by_file.items()}
+        if filenames:
+            parts = [self._filename_rows[name] for name in filenames if name in self._filename_rows]
+            rows = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        else:
+            rows = np.arange(self._count)
+        if pages is not None and (isinstance(pages, range) or pages):
+            wanted = pages if isinstance(pages, range) else {int(p) for p in pages}
+            rows = np.array([row for row in rows if self._payloads[row].get("page") in wanted], dtype=np.int64)
+        if self._deleted:
+            rows = rows[~np.isin(rows, list(self._deleted))]
+        return rows
+
+    def flush(self):
+        if self._staging is not None:
+            return self._staging.flush()
+        with self._lock:
+            if self._vectors is None:
+                return
+            if self._deleted:
+                self._compact()
+            self._vectors.flush()
+            tmp_path = self._path("payloads.jsonl.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for point_id, payload in zip(self._ids, self._payloads):
+                    f.write(json.dumps({"id": point_id, "payload": payload}) + "\n")
+            os.replace(tmp_path, self._path("payloads.jsonl"))
+            tmp_path = self._path("index.json.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": config.EMBEDDING_DIM, "dtype": self.dtype.name, "count": self._count,
+                           "created": self._created}, f)
+            os.replace(tmp_path, self._path("index.json"))
+            if self._lexical is not None:
+                self._lexical.save()
+
+    def _to_chunk(self, row, with_vectors):
+        chunk = dict(self._payloads[row], point_id=self._ids[row])
+        if with_vectors:
+            chunk["vector"] = np.array(self._vectors[row], dtype=np.float32)
+        return chunk
+
+    def get_chunks(self, point_ids, with_vectors=False):
+        with self._lock:
+            return {point_id: self._to_chunk(self._rows[point_id], with_vectors)
+                    for point_id in point_ids if point_id in self._rows}
+
+    def dense_search_many(self, query_embs, top_k=3, filenames=None, pages=None, with_vectors=False,
+                          **search_params):
+        # Exact search already; HNSW tuning knobs don't apply
+        queries = np.asarray(query_embs, dtype=np.float32).reshape(len(query_embs), -1)
+        with self._lock:
+            if self._vectors is None or self._count == 0:
+                return [[] for _ in range(len(queries))]
+            filtered = bool(filenames) or pages is not None or self._deleted
+            rows = self._candidate_rows(filenames, pages) if filtered else None
+            n = self._count if rows is None else len(rows)
+            k = min(top_k, n)
+            if k <= 0:
+                return [[] for _ in range(len(queries))]
+            results = []
+            # Each block of rows is scored against a group of queries with one matmul
+            for group_start in range(0, len(queries), self._QUERY_BLOCK):
+                group = queries[group_start:group_start + self._QUERY_BLOCK]
+                scores = np.empty((n, len(group)), dtype=np.float32)
+                for start in range(0, n, self._SEARCH_BLOCK):
+                    stop = min(start + self._SEARCH_BLOCK, n)
+                    block = self._vectors[start:stop] if rows is None else self._vectors[rows[start:stop]]
+                    scores[start:stop] = block.astype(np.float32, copy=False) @ group.T
+                # argpartition finds the top k in O(n); only those k are fully sorted
+                top = np.argpartition(-scores, k - 1, axis=0)[:k]
+                for j in range(len(group)):
+                    column = top[:, j]
+                    column = column[np.argsort(-scores[column, j])]
+                    if rows is not None:
+                        column = rows[column]
+                    results.append([self._to_chunk(row, with_vectors) for row in column])
+            return results
@@ -0,0 +1,34 @@
+import numpy as np
+
+
+def mmr_select(query_vector, vectors, k, lambda_mult=0.5):
+    """
+    Maximal marginal relevance: greedily pick k rows of `vectors`, each maximizing
+    lambda_mult * sim(query, row) - (1 - lambda_mult) * max sim(row, already picked).
+    lambda_mult=1 is plain relevance order; lower values favour diversity.
+    Returns the picked row indices in selection order.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+    relevance = vectors @ query_vector
+    similarity = vectors @ vectors.T  # All pairwise similarities in one matmul
+    first = int(np.argmax(relevance))
+    selected = [first]
+    available = np.ones(n, dtype=bool)
+    available[first] = False
+    # Similarity of every row to its closest already-selected row, updated per pick
+    max_similarity = similarity[first].copy()
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(max_similarity, similarity[pick], out=max_similarity)
+    return selected
@@ -0,0 +1,164 @@
+import argparse
+import inspect
+import json
+import os
+import numpy as np
+import config
+
+# ONNX Runtime backend for CPU-only hosts. onnxruntime/onnx are only imported
+# when this backend is selected (EMBEDDING_BACKEND = "onnx") or the CLI is run.
+
+
+def onnx_model_path(quantize=None):
+    quantize = config.ONNX_QUANTIZE if quantize is None else quantize
+    return os.path.join(config.ONNX_MODEL_DIR, "model.int8.onnx" if quantize else "model.onnx")
+
+
+def _pooling_mode(model_dir):
+    # sentence-transformers records the pooling it was trained with; bge uses the CLS token
+    pooling_config = os.path.join(model_dir, "1_Pooling", "config.json")
+    if os.path.exists(pooling_config):
+        with open(pooling_config, "r", encoding="utf-8") as f:
+            if json.load(f).get("pooling_mode_mean_tokens"):
+                return "mean"
+    return "cls"
+
+
+class OnnxEmbedder:
+    """
+    Drop-in replacement for the parts of SentenceTransformer the app uses:
+    .tokenizer, .max_seq_length and .encode().
+    """
+    def __init__(self, model_path=None, threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_path = model_path or onnx_model_path()
+        model_dir = os.path.dirname(self.model_path)
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(
+                f"{self.model_path} not found. Export it first with: python -m retrieval.onnx_embedder --export"
+            )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = min(self.tokenizer.model_max_length, 512)
+        self.pooling = _pooling_mode(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = config.ONNX_INTRA_OP_THREADS if threads is None else threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, normalize_embeddings=True, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            inputs = self.tokenizer(batch, padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors="np")
+            feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self._input_names}
+            hidden = self.session.run(None, feed)[0]
+            if self.pooling == "mean":
+                mask = inputs["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            else:
+                pooled = hidden[:, 0]
+            outputs.append(pooled.astype(np.float32))
+        embeddings = np.concatenate(outputs) if outputs else np.empty((0, config.EMBEDDING_DIM), dtype=np.float32)
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+
+def export_onnx(source_model, quantize=True):
+    """
+    Export the transformer behind the sentence-transformers model to ONNX
+    (and an int8 dynamically-quantized copy) under ONNX_MODEL_DIR.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(config.ONNX_MODEL_DIR, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(source_model)
+    model = AutoModel.from_pretrained(source_model).eval()
+    tokenizer.save_pretrained(config.ONNX_MODEL_DIR)
+    pooling_config = os.path.join(source_model, "1_Pooling", "config.json")
+    if os.path.exists(pooling_config):
+        os.makedirs(os.path.join(config.ONNX_MODEL_DIR, "1_Pooling"), exist_ok=True)
+        with open(pooling_config, "rb") as src, open(os.path.join(config.ONNX_MODEL_DIR, "1_Pooling", "config.json"), "wb") as dst:
+            dst.write(src.read())
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = list(sample.keys())
+
+    class _Wrapper(torch.nn.Module):
+        # Bind inputs by name; positional order of forward() differs between transformers versions
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return self.inner(**dict(zip(input_names, inputs))).last_hidden_state
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False  # Newer torch defaults to the dynamo exporter, which needs onnxscript
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(model), tuple(sample[name] for name in input_names), onnx_model_path(quantize=False),
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=14, **export_kwargs
+        )
+    print(f"Exported {onnx_model_path(quantize=False)}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(onnx_model_path(quantize=False), onnx_model_path(quantize=True), weight_type=QuantType.QInt8)
+        print(f"Quantized {onnx_model_path(quantize=True)}")
+
+
+PARITY_TEXTS = [
+    "What is the refund policy for damaged items?",
+    "The quarterly report shows revenue growth of 12% driven by the services segment.",
+    "Section 4.2: All employees must complete safety training before operating equipment.",
+    "Part number XK-2291-B replaces the discontinued XK-2291-A assembly.",
+]
+
+
+def check_parity(reference_model, quantize=None, texts=None):
+    """
+    Compare ONNX vectors against the PyTorch SentenceTransformer on the same texts.
+    Returns the minimum cosine similarity between matching vectors.
+    """
+    texts = texts or PARITY_TEXTS
+    reference = reference_model.encode(texts, normalize_embeddings=True)
+    candidate = OnnxEmbedder(onnx_model_path(quantize)).encode(texts, normalize_embeddings=True)
+    return float(np.min(np.sum(reference * candidate, axis=1)))
+
+
+def main():
+    from retrieval.embedder import load_sentence_transformer, sentence_transformer_source
+
+    parser = argparse.ArgumentParser(description="Export and verify the ONNX embedding backend")
+    parser.add_argument("--export", action="store_true", help="Export the embedding model to ONNX")
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 quantized copy")
+    parser.add_argument("--check", action="store_true", help="Compare ONNX and PyTorch embeddings")
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx(sentence_transformer_source(), quantize=not args.no_quantize)
+    if args.check:
+        reference = load_sentence_transformer()
+        variants = [False] if args.no_quantize else [False, True]
+        for quantize in variants:
+            similarity = check_parity(reference, quantize=quantize)
+            threshold = config.ONNX_PARITY_MIN_COSINE_INT8 if quantize else config.ONNX_PARITY_MIN_COSINE
+            status = "OK" if similarity >= threshold else "FAIL"
+            print(f"[{status}] {onnx_model_path(quantize)}: min cosine vs PyTorch = {similarity:.5f} (threshold {threshold})")
+
+
+if __name__ == "__main__":
+    main()
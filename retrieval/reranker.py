@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+from retrieval.embedding_cache import text_key
+from utils.lru_cache import LRUCache
+import config
+
+_model = None
+_model_lock = threading.Lock()
+
+# (model, query, chunk text) -> cross-encoder score; chunks are keyed by content so
+# the cache stays valid across re-ingests that keep the text unchanged
+score_cache = LRUCache(maxsize=config.RERANK_CACHE_SIZE, ttl=config.RERANK_CACHE_TTL)
+
+def reranker_source():
+    # Prefer the local copy for offline use
+    local_model_path = os.path.join(config.MODELS_DIR, os.path.basename(config.RERANK_MODEL_NAME))
+    if os.path.exists(local_model_path):
+        return local_model_path
+    return config.RERANK_MODEL_NAME
+
+def get_reranker():
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+            _model = CrossEncoder(reranker_source(), max_length=config.RERANK_MAX_LENGTH)
+    return _model
+
+def rerank(query, chunks, top_k=None, budget_ms=None):
+    """
+    Reorder candidate chunks by cross-encoder relevance and return the best top_k
+    (default MAX_CONTEXT_CHUNKS), each with a 'rerank_score'.
+    Uncached pairs are scored in batches of RERANK_BATCH_SIZE;
+    once budget_ms has elapsed no further batches are started, and the candidates left
+    unscored follow the scored ones in their retrieval order.
+    """
+    top_k = top_k or config.MAX_CONTEXT_CHUNKS
+    budget_ms = config.RERANK_BUDGET_MS if budget_ms is None else budget_ms
+    if not chunks:
+        return []
+    start = time.perf_counter()
+    model_id = reranker_source()
+    query_key = text_key(query)
+    keys = [(model_id, query_key, text_key(c["chunk_text"])) for c in chunks]
+    scores = [score_cache.get(key) for key in keys]
+    pending = [i for i, score in enumerate(scores) if score is None]
+    if pending:
+        model = get_reranker()
+        for offset in range(0, len(pending), config.RERANK_BATCH_SIZE):
+            if budget_ms and offset and (time.perf_counter() - start) * 1000 > budget_ms:
+                print(f"[WARN] Rerank budget of {budget_ms} ms exceeded; {len(pending) - offset} candidates left unscored")
+                break
+            batch = pending[offset:offset + config.RERANK_BATCH_SIZE]
+            batch_scores = model.predict([(query, chunks[i]["chunk_text"]) for i in batch],
+                                         batch_size=len(batch), show_progress_bar=False)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                score_cache.put(keys[i], scores[i])
+    scored = sorted((i for i, score in enumerate(scores) if score is not None), key=lambda i: scores[i], reverse=True)
+    unscored = [i for i, score in enumerate(scores) if score is None]
+    return [dict(chunks[i], rerank_score=scores[i]) for i in (scored + unscored)[:top_k]]
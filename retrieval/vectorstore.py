@@ -1,60 +1,493 @@
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct, Filter, FieldCondition, MatchValue
+from qdrant_client.http.exceptions import UnexpectedResponse, ResponseHandlingException
+try:
+    from qdrant_client.common.client_exceptions import ResourceExhaustedResponse  # 429 with Retry-After
+except ImportError:  # Older qdrant-client raises UnexpectedResponse(429) instead
+    ResourceExhaustedResponse = ()
+from qdrant_client.models import VectorParams, Distance, PointStruct, PointIdsList, Filter, FieldCondition, MatchValue
+from qdrant_client.models import MatchAny, Range, PayloadSchemaType, QueryRequest
+from qdrant_client.models import CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+from qdrant_client.models import (
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, BinaryQuantization, BinaryQuantizationConfig,
+    SearchParams, QuantizationSearchParams, HnswConfigDiff
+)
 from sentence_transformers import SentenceTransformer
+from retrieval.base import VectorStore
+from retrieval.bm25 import BM25Index
+from retrieval.docstore import ChunkDocstore
 import config
+import grpc
+import httpx
 import os
+import time
+import threading
 import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
-class QdrantVectorStore:
-    def __init__(self):
-        self.client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
+PROFILE_DEFAULTS = {
+    "quantization": None,  # None, "scalar" (int8) or "binary"
+    "quantile": 0.99,  # Scalar quantization clips outliers beyond this quantile
+    "always_ram": True,  # Keep quantized vectors in RAM
+    "on_disk_vectors": False,  # Keep original float32 vectors on disk (memory-mapped)
+    "on_disk_payload": False,
+    "oversampling": 1.0,  # Fetch top_k * oversampling candidates from the quantized index...
+    "rescore": True,  # ...and rescore them with the original vectors
+    "hnsw_m": None,  # HNSW graph degree; None = server default (16). Higher = better recall, more RAM
+    "hnsw_ef_construct": None,  # Build-time beam width; None = server default (100)
+    "hnsw_ef": None,  # Query-time beam width; None = server default. Higher = better recall, slower
+}
 
-    def reset_collection(self):
-        collections = [c.name for c in self.client.get_collections().collections]
-        if config.QDRANT_COLLECTION in collections:
+def collection_profile():
+    profile = dict(PROFILE_DEFAULTS)
+    profile.update(config.QDRANT_COLLECTION_PROFILES[config.QDRANT_COLLECTION_PROFILE])
+    return profile
+
+# Fields that searches filter on; indexed so Qdrant can filter during the HNSW traversal
+PAYLOAD_INDEXES = {
+    "filename": PayloadSchemaType.KEYWORD,
+    "page": PayloadSchemaType.INTEGER,
+}
+
+def build_filter(filenames=None, pages=None):
+    """
+    filenames: iterable of file names to search in.
+    pages: iterable of page numbers, or a range() of pages.
+    """
+    conditions = []
+    if filenames:
+        conditions.append(FieldCondition(key="filename", match=MatchAny(any=list(filenames))))
+    if isinstance(pages, range):
+        conditions.append(FieldCondition(key="page", range=Range(gte=pages.start, lt=pages.stop)))
+    elif pages:
+        conditions.append(FieldCondition(key="page", match=MatchAny(any=[int(p) for p in pages])))
+    return Filter(must=conditions) if conditions else None
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_qdrant_client():
+    """
+    One QdrantClient per process, shared by every store and Streamlit session,
+    so connections (REST keep-alive or gRPC channels) are reused instead of re-opened.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            kwargs = {}
+            if config.QDRANT_POOL_SIZE:
+                kwargs["pool_size"] = config.QDRANT_POOL_SIZE
+            _client = QdrantClient(
+                host=config.QDRANT_HOST,
+                port=config.QDRANT_PORT,
+                grpc_port=config.QDRANT_GRPC_PORT,
+                prefer_grpc=config.QDRANT_PREFER_GRPC,
+                timeout=config.QDRANT_TIMEOUT,
+                **kwargs
+            )
+    return _client
+
+_TRANSIENT_GRPC_CODES = {grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED,
+                         grpc.StatusCode.RESOURCE_EXHAUSTED}
+
+def _is_transient(error):
+    # Only connection problems, timeouts, 5xx and 429 are worth retrying; bad points
+    # (4xx, ValueError, validation errors) fail the same way every time
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code >= 500 or error.status_code == 429
+    if isinstance(error, ResponseHandlingException):
+        error = error.source  # The REST client wraps transport errors
+    if isinstance(error, grpc.RpcError):
+        return error.code() in _TRANSIENT_GRPC_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError, ResourceExhaustedResponse))
+
+class QdrantVectorStore(VectorStore):
+    """
+    QDRANT_COLLECTION is an alias for a versioned collection (QDRANT_COLLECTION_v<millis>).
+    Searches go through the alias; a rebuild fills a new version and then swaps the alias
+    atomically, so queries never see an empty or half-built collection.
+    """
+    def __init__(self, client=None):
+        self.client = client or get_qdrant_client()
+        self._upsert_executor = None
+        self._pending_upserts = deque()
+        self._barrier_point = None
+        self._rebuild_collection = None  # Version being built while a rebuild is in progress
+        self._live = None  # Cached live_collection(), for locating its BM25 index
+        self._lexical = {}  # Collection name -> BM25Index (hybrid search)
+        # With the docstore, chunk text lives locally and Qdrant payloads hold only PAYLOAD_INDEXES fields
+        self.docstore = ChunkDocstore() if config.DOCSTORE_ENABLED else None
+
+    @property
+    def name(self):
+        return config.QDRANT_COLLECTION
+
+    def _write_target(self):
+        return self._rebuild_collection or config.QDRANT_COLLECTION
+
+    def live_collection(self):
+        """Name of the collection the alias points at (or the legacy plain collection), None if neither exists."""
+        for alias in self.client.get_aliases().aliases:
+            if alias.alias_name == config.QDRANT_COLLECTION:
+                return alias.collection_name
+        if self.client.collection_exists(config.QDRANT_COLLECTION):
+            return config.QDRANT_COLLECTION
+        return None
+
+    def index_version(self):
+        # The versioned collection behind the alias; asked each time so rebuilds by other processes show up
+        self._live = self.live_collection()
+        return self._live
+
+    def _lexical_for(self, collection_name):
+        index = self._lexical.get(collection_name)
+        if index is None:
+            index = BM25Index.load(os.path.join(config.BM25_DIR, collection_name + ".pkl"))
+            self._lexical[collection_name] = index
+        return index
+
+    def _drop_lexical(self, collection_name):
+        self._lexical.pop(collection_name, None)
+        path = os.path.join(config.BM25_DIR, collection_name + ".pkl")
+        if os.path.exists(path):
+            os.remove(path)
+
+    def lexical_index(self, for_write=False):
+        """BM25 index of the live collection, or of the one being rebuilt when for_write is set."""
+        if config.SEARCH_MODE != "hybrid":
+            return None
+        if for_write and self._rebuild_collection is not None:
+            return self._lexical_for(self._rebuild_collection)
+        if self._live is None:
+            self._live = self.live_collection()
+        return self._lexical_for(self._live) if self._live is not None else None
+
+    def _collection_exists(self):
+        return self.live_collection() is not None
+
+    def _versions(self):
+        prefix = config.QDRANT_COLLECTION + "_v"
+        return sorted(c.name for c in self.client.get_collections().collections if c.name.startswith(prefix))
+
+    def _create_version(self):
+        name = f"{config.QDRANT_COLLECTION}_v{int(time.time() * 1000)}"
+        self.client.create_collection(collection_name=name, **self._collection_config())
+        self._ensure_payload_indexes(name)
+        return name
+
+    def _point_alias(self, collection_name):
+        operations = []
+        live = self.live_collection()
+        if live == config.QDRANT_COLLECTION:
+            # Collection from before aliases were used: it must go before the alias can take its name
             self.client.delete_collection(collection_name=config.QDRANT_COLLECTION)
-        self.client.recreate_collection(
-            collection_name=config.QDRANT_COLLECTION,
-            vectors_config=VectorParams(size=config.EMBEDDING_DIM, distance=Distance.COSINE)
-        )
+        elif live is not None:
+            operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=config.QDRANT_COLLECTION)))
+        operations.append(CreateAliasOperation(create_alias=CreateAlias(
+            collection_name=collection_name, alias_name=config.QDRANT_COLLECTION
+        )))
+        # Delete + create in one request is applied atomically
+        self.client.update_collection_aliases(change_aliases_operations=operations)
+        self._live = collection_name
+
+    def _collect_garbage(self):
+        # Keep the live version plus QDRANT_KEEP_VERSIONS older ones for rollback
+        live = self.live_collection()
+        old_versions = [name for name in self._versions() if name != live]
+        expired = old_versions[:max(0, len(old_versions) - config.QDRANT_KEEP_VERSIONS)]
+        expired_ids = []
+        for name in expired:
+            if self.docstore is not None:
+                expired_ids.extend(self._point_ids(name))
+            self.client.delete_collection(collection_name=name)
+            self._drop_lexical(name)
+        if expired_ids:
+            self._prune_docstore(expired_ids, exclude=None)
+
+    def _prune_docstore(self, point_ids, exclude):
+        """Delete the docstore entries of point_ids that no remaining version other than exclude still holds."""
+        doomed = {str(p): p for p in point_ids}
+        keep = (set(self._versions()) | {self.live_collection()}) - {exclude, None}
+        for name in keep:
+            candidates = list(doomed.values())
+            for start in range(0, len(candidates), 1000):
+                found = self.client.retrieve(collection_name=name, ids=candidates[start:start + 1000],
+                                             with_payload=False, with_vectors=False)
+                for point in found:
+                    doomed.pop(str(point.id), None)
+        self.docstore.delete_many(doomed)
 
-    def add_embeddings(self, embeddings, chunks):
-        points = []
-        for i, (emb, meta) in enumerate(zip(embeddings, chunks)):
-            points.append(PointStruct(
-                id=i,
-                vector=np.array(emb, dtype=np.float32),
-                payload={
+    def _collection_config(self):
+        profile = collection_profile()
+        quantization_config = None
+        if profile["quantization"] == "scalar":
+            quantization_config = ScalarQuantization(scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=profile["quantile"], always_ram=profile["always_ram"]
+            ))
+        elif profile["quantization"] == "binary":
+            quantization_config = BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=profile["always_ram"]))
+        return {
+            "vectors_config": VectorParams(size=config.EMBEDDING_DIM, distance=Distance.COSINE,
+                                           on_disk=profile["on_disk_vectors"]),
+            "on_disk_payload": profile["on_disk_payload"],
+            "quantization_config": quantization_config,
+            "hnsw_config": HnswConfigDiff(m=profile["hnsw_m"], ef_construct=profile["hnsw_ef_construct"]),
+        }
+
+    def _search_params(self, hnsw_ef=None, exact=False):
+        profile = collection_profile()
+        hnsw_ef = hnsw_ef or profile["hnsw_ef"]
+        quantization = None
+        if profile["quantization"]:
+            if exact:
+                # Exact means exact: score the original vectors, not the quantized copies
+                quantization = QuantizationSearchParams(ignore=True)
+            else:
+                quantization = QuantizationSearchParams(rescore=profile["rescore"], oversampling=profile["oversampling"])
+        if hnsw_ef is None and not exact and quantization is None:
+            return None
+        return SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+
+    def _ensure_payload_indexes(self, collection_name):
+        existing = self.client.get_collection(collection_name).payload_schema or {}
+        for field, schema in PAYLOAD_INDEXES.items():
+            if field not in existing:
+                self.client.create_payload_index(
+                    collection_name=collection_name, field_name=field, field_schema=schema
+                )
+
+    def begin_rebuild(self):
+        self.flush()
+        self._rebuild_collection = self._create_version()
+
+    def finish_rebuild(self):
+        self.flush()
+        new_collection, self._rebuild_collection = self._rebuild_collection, None
+        self._point_alias(new_collection)
+        self._collect_garbage()
+
+    def abort_rebuild(self):
+        for future in self._pending_upserts:
+            future.cancel()
+        self._pending_upserts.clear()
+        self._barrier_point = None
+        if self._rebuild_collection is not None:
+            self.client.delete_collection(collection_name=self._rebuild_collection)
+            self._drop_lexical(self._rebuild_collection)
+            self._rebuild_collection = None
+
+    def _point_ids(self, collection_name):
+        point_ids = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name, limit=10000, offset=offset,
+                with_payload=False, with_vectors=False
+            )
+            point_ids.extend(p.id for p in points)
+            if offset is None:
+                return point_ids
+
+    def reset_collection(self):
+        # Swap in a new empty version rather than deleting the live collection
+        self.begin_rebuild()
+        self.finish_rebuild()
+
+    def ensure_collection(self):
+        """
+        Create the collection if it does not exist yet.
+        Returns True when a new (empty) collection was created.
+        """
+        live = self.live_collection()
+        if live is not None:
+            self._ensure_payload_indexes(live)  # Collections created before the indexes existed
+            return False
+        self._point_alias(self._create_version())
+        return True
+
+    def _upsert_with_retry(self, collection_name, points, wait):
+        for attempt in range(config.QDRANT_UPSERT_RETRIES + 1):
+            try:
+                return self.client.upsert(collection_name=collection_name, points=points, wait=wait)
+            except Exception as e:
+                if attempt == config.QDRANT_UPSERT_RETRIES or not _is_transient(e):
+                    raise
+                delay = 0.5 * 2 ** attempt
+                print(f"[WARN] Qdrant upsert of {len(points)} points failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def add_embeddings(self, embeddings, chunks, flush=True):
+        """
+        Upsert in batches of QDRANT_UPSERT_BATCH_SIZE with up to QDRANT_UPSERT_PARALLEL requests in flight.
+        With flush=False the call returns once the batches are queued; call flush() when done adding.
+        """
+        if self._upsert_executor is None:
+            self._upsert_executor = ThreadPoolExecutor(max_workers=config.QDRANT_UPSERT_PARALLEL)
+        lexical = self.lexical_index(for_write=True)
+        records = (
+            (
+                meta.get("point_id", i),  # Stable content-derived id when ingesting incrementally
+                emb,
+                {
                     "filename": meta["filename"],
                     "page": meta.get("page"),  # Will be None for DOCX
                     "total_pages": meta.get("total_pages"),  # Will be None for DOCX
                     "chunk_id": meta["chunk_id"],
+                    "window": meta.get("window"),
                     "chunk_text": meta["chunk_text"],
                     "source_ref": meta.get("source_ref")
                 }
+            )
+            for i, (emb, meta) in enumerate(zip(embeddings, chunks))
+        )
+        while True:
+            records_batch = list(islice(records, config.QDRANT_UPSERT_BATCH_SIZE))
+            if not records_batch:
+                break
+            if self.docstore is not None:
+                # Written before the upsert so a search never returns an id without its text
+                self.docstore.put_many({point_id: payload for point_id, _, payload in records_batch})
+            if lexical is not None:
+                for point_id, _, payload in records_batch:
+                    lexical.add(point_id, payload["chunk_text"], payload["filename"], payload["page"])
+            batch = [
+                PointStruct(
+                    id=point_id,
+                    vector=np.array(emb, dtype=np.float32),
+                    payload=payload if self.docstore is None else {k: payload[k] for k in PAYLOAD_INDEXES}
+                )
+                for point_id, emb, payload in records_batch
+            ]
+            # Bound the number of batches held in memory waiting to be sent
+            while len(self._pending_upserts) >= config.QDRANT_UPSERT_PARALLEL * 2:
+                self._pending_upserts.popleft().result()
+            self._pending_upserts.append(self._upsert_executor.submit(
+                self._upsert_with_retry, self._write_target(), batch, config.QDRANT_UPSERT_WAIT
             ))
-        self.client.upsert(collection_name=config.QDRANT_COLLECTION, points=points)
-
-    def search(self, query, top_k=3):
-        # Use the same embedder as in embedder.py for consistency
-        from retrieval.embedder import get_embedder
-        embedder = get_embedder()
-        query_emb = embedder.encode([query], normalize_embeddings=True)[0]
-        results = self.client.search(
+            self._barrier_point = batch[-1]
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """
+        Wait for all queued upserts. When batches were sent with wait=False, re-upsert the
+        last point with wait=True: Qdrant applies updates in order, so once it is applied
+        every earlier batch is searchable too.
+        """
+        try:
+            while self._pending_upserts:
+                self._pending_upserts.popleft().result()
+        except Exception:
+            for future in self._pending_upserts:
+                future.cancel()
+            self._pending_upserts.clear()
+            raise
+        if self._barrier_point is not None and not config.QDRANT_UPSERT_WAIT:
+            self._upsert_with_retry(self._write_target(), [self._barrier_point], wait=True)
+        self._barrier_point = None
+        for lexical in self._lexical.values():
+            lexical.save()
+
+    def delete_points(self, point_ids):
+        point_ids = list(point_ids)
+        if not point_ids:
+            return
+        self.client.delete(
+            collection_name=self._write_target(),
+            points_selector=PointIdsList(points=point_ids)
+        )
+        if self.docstore is not None:
+            # Versions kept for rollback share ids with this one and still need their text
+            self._prune_docstore(point_ids, exclude=self._write_target())
+        lexical = self.lexical_index(for_write=True)
+        if lexical is not None:
+            lexical.remove(point_ids)
+
+    def search_vector(self, query_emb, top_k=3, hnsw_ef=None, exact=False, filenames=None, pages=None,
+                      with_vectors=False):
+        """
+        Raw nearest-neighbour query returning Qdrant scored points.
+        hnsw_ef overrides the profile's query-time beam width; exact=True bypasses the index
+        and any quantization.
+        filenames/pages restrict the search (see build_filter).
+        """
+        return self.client.query_points(
             collection_name=config.QDRANT_COLLECTION,
-            query_vector=query_emb,
-            limit=top_k
+            query=np.asarray(query_emb, dtype=np.float32).tolist(),
+            query_filter=build_filter(filenames, pages),
+            limit=top_k,
+            search_params=self._search_params(hnsw_ef, exact),
+            with_payload=True,  # Just filename/page with the docstore, or the full text for older points
+            with_vectors=with_vectors
+        ).points
+
+    def _hydrated(self, points):
+        # (point, payload) pairs from the docstore; points stored before it was enabled are not in it
+        # and still carry their full Qdrant payload
+        records = self.docstore.get_many(p.id for p in points)
+        for p in points:
+            payload = records.get(str(p.id))
+            if payload is None and p.payload and "chunk_text" in p.payload:
+                payload = p.payload
+            if payload is not None:
+                yield p, payload
+
+    def hydrate(self, results):
+        """Payload dicts for scored points, read from the docstore in one query when it is enabled."""
+        if self.docstore is None:
+            return [r.payload for r in results]
+        return [payload for _, payload in self._hydrated(results)]
+
+    @staticmethod
+    def _to_chunk(point_id, payload, vector=None):
+        chunk = {
+            "chunk_text": payload["chunk_text"],
+            "filename": payload["filename"],
+            "chunk_id": payload["chunk_id"],
+            "window": payload.get("window"),  # Missing in collections built before it was recorded
+            "page": payload.get("page"),
+            "total_pages": payload.get("total_pages"),
+            "source_ref": payload.get("source_ref"),
+            "point_id": point_id
+        }
+        if vector is not None:
+            chunk["vector"] = np.asarray(vector, dtype=np.float32)
+        return chunk
+
+    def _to_chunks(self, points):
+        """Chunk dicts for Qdrant points (scored or retrieved), hydrated from the docstore when enabled."""
+        if self.docstore is None:
+            return [self._to_chunk(p.id, p.payload, p.vector) for p in points]
+        return [self._to_chunk(p.id, payload, p.vector) for p, payload in self._hydrated(points)]
+
+    def get_chunks(self, point_ids, with_vectors=False):
+        points = self.client.retrieve(
+            collection_name=config.QDRANT_COLLECTION, ids=list(point_ids),
+            with_payload=True, with_vectors=with_vectors
         )
-        print("[DEBUG] Qdrant search results:", results)
-        context_chunks = []
-        for r in results:
-            payload = r.payload
-            context_chunks.append({
-                "chunk_text": payload["chunk_text"],
-                "filename": payload["filename"],
-                "chunk_id": payload["chunk_id"],
-                "page": payload.get("page"),
-                "total_pages": payload.get("total_pages"),
-                "source_ref": payload.get("source_ref")
-            })
-        return context_chunks 
\ No newline at end of file
+        return {chunk["point_id"]: chunk for chunk in self._to_chunks(points)}
+
+    def dense_search_many(self, query_embs, top_k=3, filenames=None, pages=None, with_vectors=False,
+                          hnsw_ef=None, exact=False):
+        """Queries go out QDRANT_SEARCH_BATCH_SIZE at a time through the batch query endpoint."""
+        query_filter = build_filter(filenames, pages)
+        search_params = self._search_params(hnsw_ef, exact)
+        results = []
+        for start in range(0, len(query_embs), config.QDRANT_SEARCH_BATCH_SIZE):
+            requests = [
+                QueryRequest(
+                    query=np.asarray(query_emb, dtype=np.float32).tolist(),
+                    filter=query_filter,
+                    limit=top_k,
+                    params=search_params,
+                    with_payload=True,  # Just filename/page with the docstore, or the full text for older points
+                    with_vector=with_vectors
+                )
+                for query_emb in query_embs[start:start + config.QDRANT_SEARCH_BATCH_SIZE]
+            ]
+            responses = self.client.query_batch_points(collection_name=config.QDRANT_COLLECTION, requests=requests)
+            results.extend(response.points for response in responses)
+        if len(results) == 1:
+            print("[DEBUG] Qdrant search results:", [(r.id, r.score) for r in results[0]] if with_vectors else results[0])
+        return [self._to_chunks(points) for points in results]
@@ -12,7 +12,7 @@ pip install --no-cache-dir --find-links=./wheels -r requirements.txt || pip inst
 
 # 3. Start Qdrant (Docker required)
 echo "Starting Qdrant via Docker..."
-docker run -d --name qdrant_rag -p 6333:6333 -v $(pwd)/docs_index:/qdrant/storage qdrant/qdrant
+docker run -d --name qdrant_rag -p 6333:6333 -p 6334:6334 -v $(pwd)/docs_index:/qdrant/storage qdrant/qdrant
 
 echo "\n---"
 echo "Download GGUF LLMs manually from HuggingFace and place in ./models/"
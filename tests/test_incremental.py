@@ -0,0 +1,135 @@
+import hashlib
+import numpy as np
+import pytest
+from docx import Document
+import config
+import ingest.pipeline
+from ingest.document_loader import iter_chunks, iter_documents
+from ingest.incremental import assign_point_ids, sync_directory
+from retrieval.local_store import LocalVectorStore
+
+CHUNK_SIZE = 100
+OVERLAP = 20
+
+
+def _write_docx(path, paragraphs):
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    doc.save(path)
+
+
+def _paragraphs(tag, count):
+    return [" ".join(f"{tag}{p}w{w}" for w in range(20)) for p in range(count)]
+
+
+def _fake_embedding(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(config.EMBEDDING_DIM).astype(np.float32)
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    calls = []
+
+    def embed_chunks(chunks):
+        calls.extend(chunks)
+        return np.stack([_fake_embedding(c["chunk_text"]) for c in chunks])
+
+    monkeypatch.setattr(ingest.pipeline, "embed_chunks", embed_chunks)
+    return calls
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "INGEST_MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(config, "SEARCH_MODE", "dense")
+    return LocalVectorStore(index_dir=str(tmp_path / "index"))
+
+
+def _sync(store, data_dir):
+    return sync_directory(store, str(data_dir), chunk_size=CHUNK_SIZE, overlap=OVERLAP, embed_workers=1)
+
+
+def test_editing_one_file_reembeds_only_its_changed_chunks(tmp_path, store, embedded):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    _write_docx(data_dir / "a.docx", _paragraphs("a", 30))
+    _write_docx(data_dir / "b.docx", _paragraphs("b", 30))
+
+    first = _sync(store, data_dir)
+    assert first["files_changed"] == 2
+    assert first["chunks_embedded"] == len(embedded)
+    assert _sync(store, data_dir)["files_changed"] == 0
+
+    # 600 words -> windows start every 80 words; 10 more words only extend the last one
+    embedded.clear()
+    _write_docx(data_dir / "b.docx", _paragraphs("b", 30) + ["appended paragraph with ten words in it right here"])
+    stats = _sync(store, data_dir)
+
+    assert stats["files_changed"] == 1
+    assert stats["files_unchanged"] == 1
+    assert stats["chunks_embedded"] == 1
+    assert stats["chunks_deleted"] == 1
+    assert [c["filename"] for c in embedded] == ["b.docx"]
+    assert embedded[0]["chunk_text"].endswith("right here")
+
+    chunks = assign_point_ids(iter_chunks(iter_documents(str(data_dir), workers=1), CHUNK_SIZE, OVERLAP))
+    point_ids = {c["point_id"] for c in chunks}
+    assert set(store.get_chunks(point_ids)) == point_ids
+
+
+def test_chunk_numbering_does_not_depend_on_other_files(tmp_path):
+    _write_docx(tmp_path / "a.docx", _paragraphs("a", 30))
+    _write_docx(tmp_path / "b.docx", _paragraphs("b", 30))
+
+    def numbering(filenames):
+        chunks = iter_chunks(iter_documents(str(tmp_path), workers=1, filenames=filenames), CHUNK_SIZE, OVERLAP)
+        return [(c["chunk_id"], c["page"], c["window"]) for c in chunks if c["filename"] == "b.docx"]
+
+    alone = numbering(["b.docx"])
+    assert alone == numbering(["a.docx", "b.docx"])
+    assert [chunk_id for chunk_id, _, _ in alone] == list(range(len(alone)))
+
+
+def test_changing_the_chunking_replaces_every_chunk(tmp_path, store, embedded):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    _write_docx(data_dir / "a.docx", _paragraphs("a", 30))
+    first = _sync(store, data_dir)
+
+    stats = sync_directory(store, str(data_dir), chunk_size=CHUNK_SIZE * 2, overlap=OVERLAP, embed_workers=1)
+    assert stats["files_changed"] == 1
+    assert stats["chunks_deleted"] == first["chunks_embedded"]
+
+    chunks = assign_point_ids(iter_chunks(iter_documents(str(data_dir), workers=1), CHUNK_SIZE * 2, OVERLAP))
+    point_ids = {c["point_id"] for c in chunks}
+    assert stats["chunks_embedded"] == len(point_ids)
+    assert set(store.get_chunks(point_ids)) == point_ids
+
+
+def test_failed_sync_still_tracks_the_chunks_it_stored(tmp_path, store, embedded, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    _write_docx(data_dir / "a.docx", _paragraphs("a", 30))
+    _sync(store, data_dir)
+    _write_docx(data_dir / "a.docx", _paragraphs("edited", 30))
+
+    add_embeddings = store.add_embeddings
+
+    def fail_after_first_batch(embeddings, chunks, flush=True):
+        add_embeddings(embeddings, chunks, flush)
+        raise TimeoutError("upsert timed out")
+
+    embedded.clear()
+    monkeypatch.setattr(store, "add_embeddings", fail_after_first_batch)
+    with pytest.raises(TimeoutError):
+        _sync(store, data_dir)
+    monkeypatch.setattr(store, "add_embeddings", add_embeddings)
+    stored = {c["point_id"] for c in embedded}
+    assert set(store.get_chunks(stored)) == stored
+
+    # The file is removed before a sync succeeds: nothing from the failed run may remain
+    (data_dir / "a.docx").unlink()
+    _sync(store, data_dir)
+    assert store.get_chunks(stored) == {}